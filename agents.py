@@ -0,0 +1,250 @@
+#coding=utf8
+import numpy as np
+
+
+class AgentStore(object):
+    """
+    Column store for agent state.
+    Columns are contiguous arrays whose capacity doubles when full,
+    so appending newborn agents costs amortized O(1) per agent.
+    Reading a column returns a view over the live prefix.
+    """
+
+    def __init__(self, columns, capacity=16):
+
+        self.size = 0
+        self.capacity = max(int(capacity), 1)
+        self.columns = {name: np.zeros(self.capacity, dtype=dtype)
+                        for name, dtype in columns.items()}
+
+    #-----------------------------------------------------------------------------------------#
+    def __len__(self):
+
+        return self.size
+
+    #-----------------------------------------------------------------------------------------#
+    def __getitem__(self, name):
+        """returns a view of column name over live agents"""
+
+        return self.columns[name][:self.size]
+
+    #-----------------------------------------------------------------------------------------#
+    def reserve(self, capacity):
+        """makes sure columns can hold capacity agents,
+        doubling current capacity until it is large enough"""
+
+        if capacity <= self.capacity:
+            return
+
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+
+        for name, column in self.columns.items():
+            new_column = np.zeros(new_capacity, dtype=column.dtype)
+            new_column[:self.size] = column[:self.size]
+            self.columns[name] = new_column
+
+        self.capacity = new_capacity
+
+    #-----------------------------------------------------------------------------------------#
+    def append(self, n, **values):
+        """appends n agents, columns given in values are filled
+        with a scalar or an array of length n, others are zeroed.
+        Returns the slice of new agents"""
+
+        start = self.size
+        self.reserve(start + n)
+
+        for name, column in self.columns.items():
+            column[start:start + n] = values.get(name, 0)
+
+        self.size += n
+
+        return slice(start, start + n)
+
+    #-----------------------------------------------------------------------------------------#
+    def remove(self, indices):
+        """removes agents at indices (distinct): the last live agents move
+        into freed slots, so live agents stay a prefix and next appends reuse the slots.
+        Returns (moved, slots): agent moved[k] is now at slots[k]"""
+
+        indices = np.unique(indices)
+        size = self.size - len(indices)
+
+        #freed slots within the new prefix, live agents past it
+        slots = indices[indices < size]
+        moved = np.setdiff1d(np.arange(size, self.size), indices, assume_unique=True)
+
+        for column in self.columns.values():
+            column[slots] = column[moved]
+
+        self.size = size
+
+        return moved, slots
+
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def nbytes(self):
+        """memory allocated by columns"""
+
+        return sum(column.nbytes for column in self.columns.values())
+
+
+class MatchingPools(object):
+    """
+    Agents of each nationality (pool of nationality - 1) in preallocated index arrays,
+    with the position of each agent in its pool. Pools are updated incrementally
+    as agents arrive (sync), leave (remove) or change slot (move).
+    During a tick, agents not drawn yet are the first available[pool] members of a pool:
+    draw swaps the drawn agent with the last available one, so drawing k agents
+    without replacement costs O(k) whatever the population. reset starts a new tick.
+    """
+
+    def __init__(self, nb_pools, capacity=16):
+
+        capacity = max(int(capacity), 1)
+        self.members = [np.zeros(capacity, dtype=np.int64) for pool in range(nb_pools)]
+        self.position = np.zeros(capacity * nb_pools, dtype=np.int64)
+        self.sizes = [0] * nb_pools
+        self.available = [0] * nb_pools
+        self.nb_agents = 0 #agents 0 to nb_agents - 1 are in pools
+
+    #-----------------------------------------------------------------------------------------#
+    def __getitem__(self, pool):
+        """returns a view of members of pool"""
+
+        return self.members[pool][:self.sizes[pool]]
+
+    #-----------------------------------------------------------------------------------------#
+    def add(self, pool, agents):
+        """appends agents to pool, arrays doubling their capacity when full"""
+
+        start, end = self.sizes[pool], self.sizes[pool] + len(agents)
+
+        if end > len(self.members[pool]):
+            members = np.zeros(max(end, 2 * len(self.members[pool])), dtype=np.int64)
+            members[:start] = self.members[pool][:start]
+            self.members[pool] = members
+
+        if len(agents) and agents.max() >= len(self.position):
+            position = np.zeros(max(agents.max() + 1, 2 * len(self.position)), dtype=np.int64)
+            position[:len(self.position)] = self.position
+            self.position = position
+
+        self.members[pool][start:end] = agents
+        self.position[agents] = np.arange(start, end)
+        self.sizes[pool] = end
+
+    #-----------------------------------------------------------------------------------------#
+    def sync(self, nationality):
+        """adds agents nb_agents to len(nationality) to the pools of their nationality,
+        in order of index"""
+
+        new = nationality[self.nb_agents:]
+
+        for pool in range(len(self.members)):
+            self.add(pool, self.nb_agents + np.flatnonzero(new == pool + 1))
+
+        self.nb_agents = len(nationality)
+
+    #-----------------------------------------------------------------------------------------#
+    def remove(self, agents, pools):
+        """removes agents (distinct, agents[k] being in pools[k]) leaving the population,
+        the last member of a pool taking the position of a removed agent"""
+
+        for agent, pool in zip(agents.tolist(), pools.tolist()):
+            members = self.members[pool]
+            last = self.sizes[pool] - 1
+            members[self.position[agent]] = members[last]
+            self.position[members[last]] = self.position[agent]
+            self.sizes[pool] = last
+
+        self.nb_agents -= len(agents)
+
+    #-----------------------------------------------------------------------------------------#
+    def move(self, agents, slots, pools):
+        """agents[k] of pools[k] now has index slots[k] (see AgentStore.remove)"""
+
+        position = self.position[agents]
+
+        for pool in np.unique(pools):
+            moving = pools == pool
+            self.members[pool][position[moving]] = slots[moving]
+
+        self.position[slots] = position
+
+    #-----------------------------------------------------------------------------------------#
+    def reset(self):
+        """every agent is available again (new tick)"""
+
+        self.available = list(self.sizes)
+
+    #-----------------------------------------------------------------------------------------#
+    def draw(self, pool, u):
+        """returns an available agent of pool, drawn with the uniform number u,
+        which is no longer available until reset"""
+
+        n = self.available[pool]
+        k = int(u * n)
+        members = self.members[pool]
+        agent, last = members[k], members[n - 1]
+
+        members[k], members[n - 1] = last, agent
+        self.position[last], self.position[agent] = k, n - 1
+        self.available[pool] = n - 1
+
+        return agent
+
+
+class RewardBuffer(object):
+    """
+    Rewards of the agents who met during the current tick, 
+    stored in order as typed records (agent, reward, currency).
+    Capacity doubles when full and is kept between ticks.
+    """
+
+    dtype = np.dtype([("agent", np.int64), ("reward", np.float32), ("currency", np.int8)])
+
+    def __init__(self, capacity=16):
+
+        self.size = 0
+        self.records = np.zeros(max(int(capacity), 1), dtype=self.dtype)
+
+    #-----------------------------------------------------------------------------------------#
+    def __len__(self):
+
+        return self.size
+
+    #-----------------------------------------------------------------------------------------#
+    def __getitem__(self, name):
+        """returns a view of field name over records of the tick"""
+
+        return self.records[name][:self.size]
+
+    #-----------------------------------------------------------------------------------------#
+    def add(self, agent, reward, currency):
+        """appends records, arguments are scalars or arrays of same length"""
+
+        agent = np.atleast_1d(agent)
+        n = len(agent)
+        start = self.size
+
+        if start + n > len(self.records):
+            capacity = len(self.records)
+            while capacity < start + n:
+                capacity *= 2
+            records = np.zeros(capacity, dtype=self.dtype)
+            records[:start] = self.records[:start]
+            self.records = records
+
+        new = self.records[start:start + n]
+        new["agent"] = agent
+        new["reward"] = reward
+        new["currency"] = currency
+        self.size += n
+
+    #-----------------------------------------------------------------------------------------#
+    def clear(self):
+
+        self.size = 0
@@ -0,0 +1,261 @@
+#coding=utf8
+import time
+import numpy as np
+from eco import Economy
+
+
+class BatchedEconomy(Economy):
+    """
+    n_replicas independent economies sharing the same parameters,
+    advanced in lockstep with array operations (batched matching rules).
+    Nationality and type don't depend on chance and are shared,
+    currency is a (replica, agent) array, value a (replica, 3, 3) array.
+    Replicas are removed from the arrays when they converge.
+    """
+
+    #replicas and their pools are not part of the saved state
+    checkpoints = False
+
+    def __init__(self, parameters, n_replicas, seed=None):
+
+        #replicas share agent slots, exits would differ between replicas
+        if parameters.get("exit") is not None:
+            raise NotImplementedError("exits are not supported for BatchedEconomy")
+
+        super(BatchedEconomy, self).__init__(dict(parameters, matching="batched"), seed)
+
+        self.n_replicas = n_replicas
+        self.replicas = np.arange(n_replicas) #ids of replicas still running
+
+        self.currencies = np.zeros((n_replicas, self.agents.capacity), dtype=np.int8)
+        self.value = np.repeat(self.value[None].astype(float), n_replicas, axis=0)
+        self.counts = np.repeat(self.counts[None], n_replicas, axis=0)
+        self.steady_state = np.ones((n_replicas, self.nb_countries + 1))
+
+        #(replica, nationality, currency) cells and rewards of the tick
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.cell_rewards = np.zeros(0)
+
+        #final state of each replica, filled when it stops
+        self.results = {"steps": np.zeros(n_replicas, dtype=np.int64),
+                        "converged": np.zeros(n_replicas, dtype=bool),
+                        "stationary": np.zeros(n_replicas, dtype=bool),
+                        "value": np.zeros(self.value.shape),
+                        "counts": np.zeros(self.counts.shape, dtype=np.int64),
+                        "steady_state": np.zeros(self.steady_state.shape),
+                        "equilibrium": np.zeros(self.steady_state.shape, dtype=bool)}
+
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def currency(self):
+        """currency held by each agent of each running replica"""
+        return self.currencies[:, :len(self.agents)]
+
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def equilibrium(self):
+        """returns current equilibrium state of each running replica"""
+
+        foreign = self.counts.sum(axis=2) - self.counts[:, :, 0] \
+                  - np.diagonal(self.counts, axis1=1, axis2=2)
+
+        return (foreign > 0) & (self.steady_state[:, 1:2] < self.equilibrium_tol)
+
+    #-----------------------------------------------------------------------------------------#
+    def add_newborn(self, newborn):
+        """add newborn citizen to population,
+        money is shuffled independently in each replica"""
+
+        for i in range(len(newborn)):
+            start = len(self.agents)
+            self.agents.append(len(newborn[i]), nationality=i + 1)
+
+            if self.currencies.shape[1] < self.agents.capacity:
+                currencies = np.zeros((len(self.replicas), self.agents.capacity), dtype=np.int8)
+                currencies[:, :start] = self.currencies[:, :start]
+                self.currencies = currencies
+
+            shuffle = np.argsort(self.streams["money"].random((len(self.replicas), len(newborn[i]))),
+                                 axis=1)
+            self.currencies[:, start:len(self.agents)] = newborn[i][shuffle]
+            self.counts[:, i + 1] += np.bincount(newborn[i], minlength=self.nb_countries + 1)
+
+    #-----------------------------------------------------------------------------------------#
+    def poisson_distribution(self):
+        """returns number of meeting of each running replica
+        for pairs of countries in self.pairs"""
+
+        return self.streams["meetings"].poisson(self.meeting_rates * self.tick, 
+                                                (len(self.replicas), len(self.pairs)))
+
+    #-----------------------------------------------------------------------------------------#
+    def main_agents_random_matching(self, nationality, meetings):
+        """draws all ii and ij pairs of every replica at once
+        (same rules as Economy.batched_agents_random_matching)
+        and makes the exchanges"""
+
+        n_replicas = len(self.replicas)
+        rows = np.arange(n_replicas)[:, None]
+        perms = [pool[np.argsort(self.streams["matching"].random((n_replicas, len(pool))), axis=1)]
+                 for pool in nationality]
+        replica, first, second = [], [], []
+        home_pairs = self.pairs[:self.nb_home_pairs] - 1
+        foreign_pairs = np.sort(self.pairs[self.nb_home_pairs:] - 1, axis=1)
+
+        #number of agents of each pool already matched in each replica
+        offset = [np.zeros(n_replicas, dtype=np.int64) for perm in perms]
+
+        #ii matching: consecutive agents of the same shuffled pool
+        for column, (i, _) in enumerate(home_pairs):
+            k = np.minimum(meetings[:, column], perms[i].shape[1] // 2)
+            m = np.arange(k.max(initial=0))
+            valid = m < k[:, None]
+            replica.append(np.broadcast_to(rows, valid.shape)[valid])
+            first.append(perms[i][:, 0:2 * len(m):2][valid])
+            second.append(perms[i][:, 1:2 * len(m):2][valid])
+            offset[i] = 2 * k
+
+        #ij matching: next remaining agents of both pools
+        for column, (i, j) in enumerate(foreign_pairs, self.nb_home_pairs):
+            remaining = np.minimum(perms[i].shape[1] - offset[i], perms[j].shape[1] - offset[j])
+            k = np.minimum(meetings[:, column], np.maximum(remaining - 1, 0))
+            m = np.arange(k.max(initial=0))
+            valid = m < k[:, None]
+            replica.append(np.broadcast_to(rows, valid.shape)[valid])
+            for pool, picked in ((i, first), (j, second)):
+                position = np.minimum(offset[pool][:, None] + m, perms[pool].shape[1] - 1)
+                picked.append(np.take_along_axis(perms[pool], position, axis=1)[valid])
+            offset[i] = offset[i] + k
+            offset[j] = offset[j] + k
+
+        replica, first, second = [np.concatenate(i) for i in (replica, first, second)]
+
+        #one agent holds money, the other doesn't
+        first_currency = self.currencies[replica, first]
+        second_currency = self.currencies[replica, second]
+        buyer_and_seller = (first_currency == 0) != (second_currency == 0)
+
+        first_is_buyer = first_currency != 0
+        replica = replica[buyer_and_seller]
+        buyer_idx = np.where(first_is_buyer, first, second)[buyer_and_seller]
+        seller_idx = np.where(first_is_buyer, second, first)[buyer_and_seller]
+
+        self.make_choices_and_exchanges(replica, buyer_idx, seller_idx)
+
+    #-----------------------------------------------------------------------------------------#
+    def make_choices_and_exchanges(self, replica, buyer_idx, seller_idx):
+        """exchange or not, for arrays of (replica, buyer, seller)"""
+
+        buyer_nationality = self.nationality[buyer_idx].astype(np.int64)
+        seller_nationality = self.nationality[seller_idx].astype(np.int64)
+        buyer_currency = self.currencies[replica, buyer_idx]
+
+        buyer_acceptance = self.type[buyer_idx] == self.switch_type_array[self.type[seller_idx]]
+
+        seller_acceptance = (buyer_currency == seller_nationality) \
+                            | ((self.value[replica, seller_nationality, buyer_currency] - self.c)
+                               > self.value[replica, seller_nationality, 0])
+
+        exchange = buyer_acceptance & seller_acceptance
+
+        cells_per_replica = self.value[0].size
+        self.cells = np.concatenate([
+            replica * cells_per_replica + buyer_nationality * self.value.shape[2] + buyer_currency,
+            replica * cells_per_replica + seller_nationality * self.value.shape[2]])
+        self.cell_rewards = np.concatenate([exchange * 1.0, exchange * 0.5])
+
+        replica = replica[exchange]
+        buyer_currency = buyer_currency[exchange]
+        self.currencies[replica, seller_idx[exchange]] = buyer_currency
+        self.currencies[replica, buyer_idx[exchange]] = 0
+
+        np.add.at(self.counts, (replica, buyer_nationality[exchange], buyer_currency), -1)
+        np.add.at(self.counts, (replica, buyer_nationality[exchange], 0), 1)
+        np.add.at(self.counts, (replica, seller_nationality[exchange], 0), -1)
+        np.add.at(self.counts, (replica, seller_nationality[exchange], buyer_currency), 1)
+
+    #-----------------------------------------------------------------------------------------#
+    def update_values(self):
+        """moves values of each (replica, nationality, currency) cell
+        with the value rule, given rewards of the tick"""
+
+        aggregate = self.value_rule.aggregate(self.cells, self.cell_rewards, self.value.size) \
+                    if self.value_rule.uses_rewards else None
+
+        self.value_rule.update(self, aggregate)
+
+    #-----------------------------------------------------------------------------------------#
+    def get_steady_state(self):
+        """same residuals as Economy.get_steady_state for each running replica"""
+
+        shares = self.counts / self.nb
+        equilibrium = self.equilibrium
+        i, j = self.pairs[self.nb_home_pairs:].T
+        home = np.arange(self.nb_countries + 1)
+
+        #check if steady state equation is statisfied
+        flows = self.alpha[i, j] * (shares[:, i, 0] * shares[:, j, i]
+                                    - shares[:, i, i] * shares[:, j, 0] * equilibrium[:, j])
+        residual = self.growth * (self.money - shares[:, home, home])
+        np.add.at(residual, (slice(None), i), flows)
+
+        self.steady_state[:, 1:] = residual[:, 1:]
+
+    #-----------------------------------------------------------------------------------------#
+    def retire(self, done, converged=False, stationary=False):
+        """stores final state of running replicas selected by done
+        and removes them from the arrays"""
+
+        ids = self.replicas[done]
+        self.results["steps"][ids] = self.t
+        self.results["converged"][ids] = converged
+        self.results["stationary"][ids] = stationary
+        self.results["value"][ids] = self.value[done]
+        self.results["counts"][ids] = self.counts[done]
+        self.results["steady_state"][ids] = self.steady_state[done]
+        self.results["equilibrium"][ids] = self.equilibrium[done]
+
+        keep = ~done
+        self.replicas = self.replicas[keep]
+        self.currencies = self.currencies[keep]
+        self.value = self.value[keep]
+        self.counts = self.counts[keep]
+        self.steady_state = self.steady_state[keep]
+
+    #-----------------------------------------------------------------------------------------#
+    def run(self, n_steps=None, tol=None, time_budget=None, monitor=None):
+        """runs until every replica has converged (steady state residuals below tol)
+        or is stationary (convergence.ConvergenceMonitor monitor)
+        or n_steps steps / time_budget seconds are done.
+        Returns results (dict of arrays indexed by replica id)"""
+
+        start = time.perf_counter()
+        steps = 0
+
+        while len(self.replicas):
+
+            if n_steps is not None and steps >= n_steps:
+                break
+
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+
+            self.step()
+            steps += 1
+
+            if tol is not None:
+                done = np.abs(self.steady_state[:, 1:]).max(axis=1) < tol
+                if done.any():
+                    if monitor is not None:
+                        monitor.select(~done)
+                    self.retire(done, converged=True)
+
+            if monitor is not None and len(self.replicas):
+                done = monitor.update(self)
+                if done.any():
+                    monitor.select(~done)
+                    self.retire(done, stationary=True)
+
+        self.retire(np.ones(len(self.replicas), dtype=bool))
+
+        return self.results
@@ -0,0 +1,208 @@
+#coding=utf8
+import argparse
+import importlib
+import json
+import platform
+import time
+import tracemalloc
+import numpy as np
+import eco
+from profiling import STAGES
+
+
+ENGINES = {"eco": ("eco", {"matching": "scalar"}),
+           "eco-batched": ("eco", {"matching": "batched"}),
+           "eco-numba": ("eco", {"matching": "batched", "kernel": "numba"}),
+           "Matsumaya1993": ("Matsumaya1993.eco", {})}
+
+
+#-----------------------------------------------------------------------------------------#
+def make_economy(engine, nb, growth, seed=None):
+
+    module, parameters = ENGINES[engine]
+    parameters = dict(eco.PARAMETERS, nb=nb, growth=growth, **parameters)
+
+    return importlib.import_module(module).Economy(parameters, seed=seed)
+
+#-----------------------------------------------------------------------------------------#
+def bench(engine, nb, growth, steps, seed=0):
+    """times steps steps of engine with its profiler, after one untimed warm up step
+    (JIT compilation, caches), then measures peak memory of set up plus one step
+    in a separate run (tracing slows numpy down)"""
+
+    record = {"engine": engine, "nb": nb, "growth": growth, "steps": steps}
+
+    try:
+        economy = make_economy(engine, nb, growth, seed)
+        economy.step()
+        profiler = economy.enable_profiling(capacity=max(steps, 1))
+        agent_ticks = 0
+
+        for i in range(steps):
+            economy.step()
+            agent_ticks += economy.nb
+
+        timings = dict(zip(STAGES, profiler.total_seconds.tolist()))
+        economy.disable_profiling()
+        total = sum(timings.values())
+        record.update(stage_seconds=timings, total_seconds=total, final_nb=economy.nb,
+                      agent_ticks_per_sec=agent_ticks / total if total else None)
+        del economy
+
+        tracemalloc.start()
+        make_economy(engine, nb, growth, seed).step()
+        record["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    except Exception as error:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        record["error"] = "{}: {}".format(type(error).__name__, error)
+
+    return record
+
+#-----------------------------------------------------------------------------------------#
+def run(engines, sizes, growths, steps, seed=0, verbose=True):
+    """benchmarks every engine, population size and growth rate,
+    returns a JSON serializable report"""
+
+    records = []
+
+    for engine in engines:
+        for nb in sizes:
+            for growth in growths:
+                record = bench(engine, nb, growth, steps, seed)
+                records.append(record)
+                if verbose:
+                    print(summary(record))
+
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "records": records}
+
+#-----------------------------------------------------------------------------------------#
+def bench_draws(n_meetings, pool_size=1000, repeats=5, seed=0):
+    """times the two indices of n_meetings scalar meetings drawn one call per index
+    (as before random streams) and drawn as one bulk array per tick
+    (Economy.main_agents_random_matching), best of repeats"""
+
+    def per_call(rng):
+        return [(int(rng.integers(pool_size)), int(rng.integers(pool_size)))
+                for k in range(n_meetings)]
+
+    def bulk(rng):
+        return [(int(u * pool_size), int(v * pool_size))
+                for u, v in rng.random((n_meetings, 2)).tolist()]
+
+    record = {"n_meetings": n_meetings, "pool_size": pool_size}
+
+    for name, draw in (("per_call", per_call), ("bulk", bulk)):
+        best = np.inf
+        for k in range(repeats):
+            rng = np.random.default_rng(seed)
+            start = time.perf_counter()
+            draw(rng)
+            best = min(best, time.perf_counter() - start)
+        record[name + "_seconds"] = best
+
+    record["speedup"] = record["per_call_seconds"] / record["bulk_seconds"]
+
+    return record
+
+#-----------------------------------------------------------------------------------------#
+def summary(record):
+
+    if "error" in record:
+        return "{engine:>14} nb={nb:<9} growth={growth:<6} error {error}".format(**record)
+
+    return ("{engine:>14} nb={nb:<9} growth={growth:<6} {total_seconds:9.4f}s "
+            "{agent_ticks_per_sec:12.4g} agent-ticks/s "
+            "peak {peak_memory_bytes:12,d} B").format(**record)
+
+#-----------------------------------------------------------------------------------------#
+def compare(old, new, threshold=0.1):
+    """compares two reports, returns rows (engine, nb, growth, stage, old, new, ratio)
+    whose time ratio new/old exceeds 1 + threshold"""
+
+    key = lambda record: (record["engine"], record["nb"], record["growth"])
+    old_records = {key(record): record for record in old["records"] if "error" not in record}
+    regressions = []
+
+    for record in new["records"]:
+        reference = old_records.get(key(record))
+        if reference is None or "error" in record:
+            continue
+
+        pairs = [("total", reference["total_seconds"], record["total_seconds"])]
+        pairs += [(stage, reference["stage_seconds"][stage], record["stage_seconds"][stage])
+                  for stage in STAGES]
+        pairs += [("peak_memory", reference["peak_memory_bytes"], record["peak_memory_bytes"])]
+
+        for stage, before, after in pairs:
+            if before > 0 and after / before > 1 + threshold:
+                regressions.append(key(record) + (stage, before, after, after / before))
+
+    return regressions
+
+#-----------------------------------------------------------------------------------------#
+def parse_list(text, kind):
+
+    return [kind(float(value)) for value in text.split(",")]
+
+#-----------------------------------------------------------------------------------------#
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="per stage benchmark of Economy steps")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--engines", default=",".join(ENGINES))
+    run_parser.add_argument("--sizes", default="1e3,1e4,1e5,1e6,1e7")
+    run_parser.add_argument("--growth", default="0,0.02")
+    run_parser.add_argument("--steps", type=int, default=10)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="bench.json")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown reported as regression")
+
+    draws_parser = commands.add_parser("draws")
+    draws_parser.add_argument("--meetings", default="1e3,1e4,1e5")
+    draws_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "draws":
+        records = [bench_draws(n, seed=args.seed) for n in parse_list(args.meetings, int)]
+        for record in records:
+            print("{n_meetings:>9} meetings per call {per_call_seconds:.4g}s "
+                  "bulk {bulk_seconds:.4g}s (x{speedup:.1f})".format(**record))
+        return records
+
+    if args.command == "run":
+        report = run(args.engines.split(","), parse_list(args.sizes, int),
+                     parse_list(args.growth, float), args.steps, args.seed)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+        return report
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regressions = compare(old, new, args.threshold)
+    for engine, nb, growth, stage, before, after, ratio in regressions:
+        print("{:>14} nb={:<9} growth={:<6} {:>28} {:.4g} -> {:.4g} (x{:.2f})".format(
+            engine, nb, growth, stage, before, after, ratio))
+
+    if regressions:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
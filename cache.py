@@ -0,0 +1,156 @@
+#coding=utf8
+import hashlib
+import inspect
+import importlib
+import json
+import os
+import zipfile
+import numpy as np
+
+
+#modules of the simulation engine whose source is part of result keys
+ENGINE_MODULES = ("eco", "agents", "learning", "kernels", "convergence",
+                  "runner", "trajectory")
+
+#-----------------------------------------------------------------------------------------#
+def canonical(obj):
+    """JSON-able copy of obj with string keys and float numbers, so that equal
+    parameters give the same text however they were built (5 or 5.0, numpy scalars,
+    tuples or lists). Raises TypeError for other objects"""
+
+    if isinstance(obj, dict):
+        return {str(key): canonical(value) for key, value in obj.items()}
+
+    if isinstance(obj, (list, tuple, np.ndarray)):
+        return [canonical(value) for value in obj]
+
+    if obj is None or isinstance(obj, (bool, np.bool_, str)):
+        return obj.item() if isinstance(obj, np.bool_) else obj
+
+    if isinstance(obj, (int, float, np.integer, np.floating)):
+        return float(obj)
+
+    raise TypeError("{!r} can't be part of a cache key".format(obj))
+
+#-----------------------------------------------------------------------------------------#
+def engine_version(economy_class):
+    """digest of numpy version and of the source of the engine modules and of
+    the modules of economy_class and its bases: any change of the code invalidates
+    cached results"""
+
+    paths = {inspect.getsourcefile(importlib.import_module(name)) for name in ENGINE_MODULES}
+    paths |= {inspect.getsourcefile(cls) for cls in economy_class.__mro__ if cls is not object}
+
+    digest = hashlib.sha256(np.__version__.encode())
+    for path in sorted(os.path.realpath(path) for path in paths):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+#-----------------------------------------------------------------------------------------#
+def result_key(economy, **options):
+    """hex digest of the parameters, seed and engine of economy (which is at step 0)
+    and of the run options, None if they can't be hashed"""
+
+    seed = economy.seed_sequence
+
+    try:
+        text = json.dumps(canonical({"parameters": economy.parameters,
+                                     "seed": [str(seed.entropy), list(seed.spawn_key)],
+                                     "engine": [type(economy).__qualname__,
+                                                engine_version(type(economy))],
+                                     "run": options}), sort_keys=True)
+    except TypeError:
+        return None
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Results of runs stored in directory path, one .npz file per key (see result_key).
+    Entries are written to a temporary file renamed in place, so processes sharing
+    the directory never read partial entries. Reading an entry updates its modification
+    time, and least recently used entries are removed when files exceed max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=2 ** 30):
+
+        self.path = path
+        self.max_bytes = max_bytes
+
+        os.makedirs(path, exist_ok=True)
+
+    #-----------------------------------------------------------------------------------------#
+    def entry(self, key):
+
+        return os.path.join(self.path, key + ".npz")
+
+    #-----------------------------------------------------------------------------------------#
+    def get(self, key, load):
+        """returns load(path) of the entry of key, None if there is none
+        (or if it was removed meanwhile by another process)"""
+
+        path = self.entry(key)
+
+        try:
+            result = load(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return result
+
+    #-----------------------------------------------------------------------------------------#
+    def put(self, key, result):
+        """stores result (with a save method writing to a file) as the entry of key,
+        then evicts least recently used entries"""
+
+        path = self.entry(key)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+
+        with open(temporary, "wb") as f:
+            result.save(f)
+        os.replace(temporary, path)
+
+        self.evict()
+
+    #-----------------------------------------------------------------------------------------#
+    def evict(self):
+        """removes least recently used entries until they fit in max_bytes"""
+
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+
+        for _, entry_size, name in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    #-----------------------------------------------------------------------------------------#
+    def clear(self):
+
+        for name in os.listdir(self.path):
+            if name.endswith(".npz"):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
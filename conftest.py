@@ -0,0 +1,38 @@
+#coding=utf8
+import numpy as np
+import pytest
+
+
+#-----------------------------------------------------------------------------------------#
+@pytest.fixture
+def random_state():
+    """returns randomize(economy, seed), which gives agents of economy random currencies
+    (counts follow) and random values, so that some foreign currencies are acceptable.
+    Returns the economy"""
+
+    def randomize(economy, seed):
+
+        rng = np.random.default_rng(seed)
+
+        economy.currency[:] = rng.integers(0, economy.nb_countries + 1, size=len(economy.agents))
+        economy.counts[:] = 0
+        np.add.at(economy.counts, (economy.nationality, economy.currency), 1)
+        economy.value[1:] = rng.random(economy.value[1:].shape)
+
+        return economy
+
+    return randomize
+
+#-----------------------------------------------------------------------------------------#
+@pytest.fixture
+def agree():
+    """returns agree(a, b, z=4.): whether means over replications (axis 0)
+    of a and b are within z standard errors"""
+
+    def means_agree(a, b, z=4.):
+
+        error = np.sqrt((np.var(a, axis=0) / len(a) + np.var(b, axis=0) / len(b)))
+
+        return np.all(np.abs(np.mean(a, axis=0) - np.mean(b, axis=0)) <= z * error + 1e-12)
+
+    return means_agree
@@ -0,0 +1,205 @@
+#coding=utf8
+from functools import partial
+import numpy as np
+
+
+#-----------------------------------------------------------------------------------------#
+def observe(economy):
+    """returns values, steady state residuals and m_ij shares (agents of nationality i
+    holding currency j over population) of economy as one vector
+    (one row per running replica for a BatchedEconomy)"""
+
+    value = np.asarray(economy.value, dtype=float)[..., 1:, :]
+    residual = np.asarray(economy.steady_state, dtype=float)[..., 1:]
+    shares = (economy.counts / economy.nb)[..., 1:, :]
+    batch = residual.shape[:-1]
+
+    return np.concatenate([value.reshape(batch + (-1,)), residual,
+                           shares.reshape(batch + (-1,))], axis=-1)
+
+#-----------------------------------------------------------------------------------------#
+def mean_test(previous, recent, tol=1e-3, z=3.):
+    """window means differ by at most tol"""
+
+    return np.abs(recent.mean(axis=0) - previous.mean(axis=0)) <= tol
+
+#-----------------------------------------------------------------------------------------#
+def welch_test(previous, recent, tol=1e-3, z=3.):
+    """Welch's t statistic of the difference of window means is at most z
+    (or the difference at most tol)"""
+
+    error = np.sqrt((previous.var(axis=0, ddof=1) + recent.var(axis=0, ddof=1)) / len(recent))
+
+    return np.abs(recent.mean(axis=0) - previous.mean(axis=0)) <= z * error + tol
+
+#-----------------------------------------------------------------------------------------#
+def drift_test(previous, recent, tol=1e-3, z=3.):
+    """change along the least squares line through both windows is at most tol,
+    or its slope is not significant at z"""
+
+    y = np.concatenate([previous, recent])
+    n = len(y)
+    x = (np.arange(n) - (n - 1) / 2.).reshape((n,) + (1,) * (y.ndim - 1))
+    y = y - y.mean(axis=0)
+
+    slope = (x * y).sum(axis=0) / (x ** 2).sum()
+    error = np.sqrt(((y - slope * x) ** 2).sum(axis=0) / (n - 2) / (x ** 2).sum())
+
+    return np.abs(slope) * n <= z * error * n + tol
+
+TESTS = {"mean": mean_test, "welch": welch_test, "drift": drift_test}
+
+
+class ConvergenceMonitor(object):
+    """
+    Sliding windows over the values, steady state residuals and m_ij shares
+    of an economy (see observe), updated after every step: the last 2 * window
+    observations are kept in a ring buffer, as a previous and a recent window.
+    The economy is stationary when test passes for every quantity between both windows
+    ("mean", "welch" or "drift" with thresholds tol and z, see TESTS, or a function of
+    (previous, recent) returning a boolean per quantity) and, if residual_tol is given,
+    recent mean steady state residuals of every country are below it.
+    With max_tick > 1, the tick of the economy is coarsened while it is far from
+    steady state: each full recent window, it becomes the largest power of two
+    below recent mean residual / coarse_tol, up to max_tick. Once windows are stationary
+    at a coarse tick, it is brought back to 1 for good (residuals of a stationary economy
+    need not vanish) before stationarity can be declared.
+    Windows start over when the tick changes.
+    """
+
+    def __init__(self, window=50, test="welch", tol=1e-3, z=3., residual_tol=None,
+                 max_tick=1., coarse_tol=0.05):
+
+        assert window > 2 and max_tick >= 1
+
+        #constructor arguments (see cache.result_key)
+        self.options = {"window": window, "test": test, "tol": tol, "z": z,
+                        "residual_tol": residual_tol, "max_tick": max_tick,
+                        "coarse_tol": coarse_tol}
+
+        self.window = int(window)
+        self.test = partial(TESTS[test], tol=tol, z=z) if isinstance(test, str) else test
+        self.residual_tol = residual_tol
+        self.max_tick = max_tick
+        self.coarse_tol = coarse_tol
+        self.coarsening = max_tick > 1
+
+        self.history = None #ring buffer of observations
+        self.count = 0 #observations since windows started
+        self.groups = None #slice of each group of quantities in observations
+
+    #-----------------------------------------------------------------------------------------#
+    def reset(self):
+        """empties windows"""
+
+        self.count = 0
+
+    #-----------------------------------------------------------------------------------------#
+    def select(self, keep):
+        """keeps replicas selected by keep (see BatchedEconomy.retire)"""
+
+        if self.history is not None:
+            self.history = self.history[:, keep]
+
+    #-----------------------------------------------------------------------------------------#
+    def windows(self):
+        """returns (previous, recent) observations in order,
+        arrays of window rows (None while windows are not full)"""
+
+        if self.count < 2 * self.window:
+            return None
+
+        order = np.arange(self.count - 2 * self.window, self.count) % len(self.history)
+
+        return self.history[order[:self.window]], self.history[order[self.window:]]
+
+    #-----------------------------------------------------------------------------------------#
+    def recent(self):
+        """observations of the (possibly partial) recent window"""
+
+        n = min(self.count, self.window)
+        order = np.arange(self.count - n, self.count) % len(self.history)
+
+        return self.history[order]
+
+    #-----------------------------------------------------------------------------------------#
+    def statistics(self):
+        """returns mean and variance of each group of quantities
+        ("value", "steady_state", "shares") over the recent window"""
+
+        recent = self.recent()
+
+        return {name: (recent[..., group].mean(axis=0), recent[..., group].var(axis=0))
+                for name, group in self.groups.items()}
+
+    #-----------------------------------------------------------------------------------------#
+    def residual(self):
+        """largest recent mean steady state residual over countries
+        (of each replica for a BatchedEconomy)"""
+
+        return np.abs(self.recent()[..., self.groups["steady_state"]].mean(axis=0)).max(axis=-1)
+
+    #-----------------------------------------------------------------------------------------#
+    def stationary(self):
+        """whether windows pass the test (for each replica for a BatchedEconomy)"""
+
+        windows = self.windows()
+        if windows is None:
+            return np.zeros(self.history.shape[1:-1], dtype=bool)
+
+        passed = np.all(self.test(*windows), axis=-1)
+
+        if self.residual_tol is not None:
+            passed &= self.residual() < self.residual_tol
+
+        return passed
+
+    #-----------------------------------------------------------------------------------------#
+    def adapt_tick(self, economy):
+        """sets the tick of economy from its distance to steady state,
+        returns whether it changed"""
+
+        #the tick is shared, replicas far from steady state follow the closest one
+        distance = np.min(self.residual()) / self.coarse_tol
+        tick = 2. ** np.floor(np.log2(distance)) if distance >= 1 else 1.
+        tick = min(tick, 2. ** np.floor(np.log2(self.max_tick)))
+
+        if tick == economy.tick:
+            return False
+
+        economy.tick = tick
+        self.reset()
+
+        return True
+
+    #-----------------------------------------------------------------------------------------#
+    def update(self, economy):
+        """records the state of economy after a step and adapts its tick,
+        returns stationary() (False whenever the tick changed)"""
+
+        observation = observe(economy)
+
+        if self.history is None:
+            n = economy.nb_countries
+            self.history = np.zeros((2 * self.window,) + observation.shape)
+            self.groups = {"value": slice(0, n * (n + 1)),
+                           "steady_state": slice(n * (n + 1), n * (n + 2)),
+                           "shares": slice(n * (n + 2), observation.shape[-1])}
+
+        self.history[self.count % len(self.history)] = observation
+        self.count += 1
+
+        stationary = self.stationary()
+
+        #coarse ticks only get close to steady state, the end is done at tick 1
+        if economy.tick > 1 and np.any(stationary):
+            economy.tick = 1.
+            self.coarsening = False
+            self.reset()
+            return np.zeros_like(stationary)
+
+        if self.coarsening and self.count >= self.window and self.count % self.window == 0 \
+           and self.adapt_tick(economy):
+            return np.zeros_like(stationary)
+
+        return stationary
@@ -1,8 +1,98 @@
 #coding=utf8
+import os
 import numpy as np
 import time
 import pickle
-from itertools import compress
+from agents import AgentStore, MatchingPools, RewardBuffer
+from learning import make_rule
+from kernels import exchange_kernel
+import runner
+from profiling import Profiler, run_stage
+
+
+PARAMETERS = {"c": 0.01,
+              "u": 0.2,
+              "r": 0.1,
+              "money": {1: 0.9,
+                        2: 0.9
+                        },
+              "alpha": {"1_1": 8,
+                        "1_2": 9,
+                        "2_1": 9,
+                        "2_2": 8
+                        },
+              "v": {"1_0": 0.5,
+                    "1_1": 0.5,
+                    "1_2": 0.5,
+                    "2_0": 0.5,
+                    "2_1": 0.5,
+                    "2_2": 0.5
+                    },
+              "nb_type": 3,
+              "nb_countries": 2,
+              "nb": 400,
+              "growth": 0.02,
+              "matching": "scalar"
+              }
+
+#independent random streams of an Economy, spawned in this order from its seed
+STREAMS = ("meetings", "matching", "money", "births")
+
+#ticks of meeting counts drawn at once (see Economy.poisson_distribution)
+SCHEDULE_BLOCK = 256
+
+
+#-----------------------------------------------------------------------------------------#
+def country_table(entries, nb_countries, default=None):
+    """returns the (nb_countries + 1, nb_countries + 1) array of entries "i_j" (row i, column j),
+    row 0 being unused. A scalar is given to every cell of rows 1 to nb_countries,
+    missing entries take default (KeyError if default is None)"""
+    
+    table = np.zeros((nb_countries + 1, nb_countries + 1))
+    
+    if not isinstance(entries, dict):
+        table[1:] = entries
+        return table
+    
+    for i in range(1, nb_countries + 1):
+        for j in range(nb_countries + 1):
+            key = "{}_{}".format(i, j)
+            table[i, j] = entries[key] if default is None or key in entries else default
+    
+    return table
+
+#-----------------------------------------------------------------------------------------#
+def country_vector(entries, nb_countries):
+    """returns the (nb_countries + 1,) array of entries by country (1 to nb_countries), 
+    a scalar is given to every country"""
+    
+    vector = np.zeros(nb_countries + 1)
+    vector[1:] = [entries[i] for i in range(1, nb_countries + 1)] \
+                 if isinstance(entries, dict) else entries
+    
+    return vector
+
+#-----------------------------------------------------------------------------------------#
+def make_parameters(nb_countries, nb_type=3, home_rate=8, foreign_rate=9, links=None, **changes):
+    """returns PARAMETERS for nb_countries countries and nb_type types:
+    meeting rate home_rate in every country and foreign_rate between linked countries
+    (every pair if links is None, else a list of pairs (i, j), both ways).
+    Money and values of country 1 are given to every country"""
+    
+    if links is None:
+        links = [(i, j) for i in range(1, nb_countries + 1) for j in range(i + 1, nb_countries + 1)]
+    
+    alpha = {"{}_{}".format(i, i): home_rate for i in range(1, nb_countries + 1)}
+    for i, j in links:
+        alpha["{}_{}".format(i, j)] = alpha["{}_{}".format(j, i)] = foreign_rate
+    
+    parameters = dict(PARAMETERS, nb_countries=nb_countries, nb_type=nb_type, alpha=alpha,
+                      nb=PARAMETERS["nb"] // PARAMETERS["nb_countries"] * nb_countries,
+                      money={i: PARAMETERS["money"][1] for i in range(1, nb_countries + 1)},
+                      v=PARAMETERS["v"]["1_0"])
+    parameters.update(changes)
+    
+    return parameters
 
 
 class Economy(object):
@@ -12,11 +102,23 @@ class Economy(object):
     (1993).
     """ 
     
-    def __init__(self, parameters):
+    #no per instance __dict__ (subclasses adding attributes get one)
+    __slots__ = ("parameters", "nb", "nb_type", "nb_countries", "c", "u", "growth", "r", "money",
+                 "matching", "switch_type", "switch_type_array", "steady_state", "t", "profiler",
+                 "rewards", "learn", "value_update", "agents", "counts", "value",
+                 "alpha", "pairs", "nb_home_pairs", "seed_sequence", "streams", "exit", 
+                 "lifetime", "value_rule", "equilibrium_tol", "kernel", "exchange_kernel",
+                 "pools", "tick", "time", "schedule", "schedule_tick")
+    
+    #save_checkpoint and load_checkpoint restore the full state (see runner.run)
+    checkpoints = True
+    
+    def __init__(self, parameters, seed=None):
         
         assert parameters["nb"] % parameters["nb_countries"] == 0
         assert 0 <= parameters["c"] < parameters["u"]
         
+        self.parameters = parameters
         self.nb = parameters["nb"]
         self.nb_type = parameters["nb_type"]
         self.nb_countries = parameters["nb_countries"] #Total of countries
@@ -24,89 +126,201 @@ class Economy(object):
         self.u = parameters["u"] #Consumption utility 
         self.growth = parameters["growth"] #Growth rate
         self.r = parameters["r"] #Time preference
-        self.money = parameters["money"] #fraction of money gave to newborn agent
+        self.money = country_vector(parameters["money"], self.nb_countries) #fraction of money 
+                                                                            #gave to newborn agent
+        self.matching = parameters.get("matching", "scalar") #"scalar" or "batched"
+        
+        assert self.matching in ("scalar", "batched")
+        
+        #exchanges of the meetings of a tick: "numpy" or "numba" array kernels (see kernels), 
+        #or "scalar" (make_choice_and_exchange one meeting at a time)
+        self.kernel = parameters.get("kernel", "numpy")
+        self.exchange_kernel = None if self.kernel == "scalar" else exchange_kernel(self.kernel)
+        
+        #agents leaving the economy: None (population grows by growth every tick), 
+        #"hazard" (each agent leaves with probability growth every tick) or "lifetime" 
+        #(agents leave at age lifetime, 1 / growth units of time by default). Newborns of the same 
+        #country replace them in their slots, so the population stays at nb
+        self.exit = parameters.get("exit")
+        self.lifetime = parameters.get("lifetime") or int(round(1 / self.growth)) \
+                        if self.exit == "lifetime" else None
+        
+        assert self.exit in (None, "hazard", "lifetime")
     
-        self.switch_type = {0: 1, 1: 2, 2: 0}
-        self.switch_country = {1: 2, 2: 1}
+        self.switch_type = {t: (t + 1) % self.nb_type for t in range(self.nb_type)}
+        self.switch_type_array = np.array([self.switch_type[t] for t in range(self.nb_type)])
        
         self.steady_state = [1] * (self.nb_countries + 1)
         
-        self.exchange_list = []
+        self.t = 0 #number of steps done
+        
+        #units of time of a step: meetings and births of a step scale with it 
+        #(convergence.ConvergenceMonitor coarsens it far from steady state)
+        self.tick = 1.
+        self.time = 0. #units of time simulated
+        
+        #meeting counts of the next ticks, drawn for the tick schedule_tick
+        self.schedule = np.zeros((0, 0), dtype=np.int32)
+        self.schedule_tick = self.tick
+        
+        self.profiler = None #see enable_profiling
+        
+        #seed is an int, a SeedSequence or None (fresh entropy), 
+        #each stream is a Generator of its own. A SeedSequence is copied 
+        #since spawning changes it
+        self.seed_sequence = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key,
+                                                    pool_size=seed.pool_size) \
+                             if isinstance(seed, np.random.SeedSequence) \
+                             else np.random.SeedSequence(seed)
+        self.streams = dict(zip(STREAMS, [np.random.default_rng(child) for child in 
+                                          self.seed_sequence.spawn(len(STREAMS))]))
+        
+        self.rewards = RewardBuffer()
         
         self.learn = 0.5
+        self.value_update = parameters.get("value_update", "sequential") #"sequential" or "mean"
+        
+        assert self.value_update in ("sequential", "mean")
+        
+        #how values evolve: "reinforcement" (with learn and value_update), 
+        #"sigmoid_bellman" or a learning.ValueRule
+        self.value_rule = make_rule(parameters.get("value_rule", "reinforcement"), 
+                                    self.learn, self.value_update)
+        
+        #steady state residual of country 1 below which countries can be in equilibrium
+        self.equilibrium_tol = parameters.get("equilibrium_tol", 0.05)
 
-        self.reward = np.zeros(self.nb, dtype=object)
-        self.type = np.zeros(self.nb)
-        
-        self.currency = np.zeros(self.nb)
-        self.nationality = np.zeros(self.nb)
-
-        self.sigmoid = lambda x: 1 / (1 + np.exp(-x)) #sigmoid function used to normalize values
-        
-        self.value =  np.array([[   0 ,  0   , 0    ],
-                               
-                               [parameters["v"]["1_0"],
-                                parameters["v"]["1_1"],
-                                parameters["v"]["1_2"]],
-                               
-                               [parameters["v"]["2_0"], 
-                                parameters["v"]["2_1"],
-                                parameters["v"]["2_2"]] ]) #Advantage of being a seller, buyer
-                                                                #depending on the currency
-        self.alpha = np.array([[   0 ,  0   , 0    ],
-                               [0, 
-                                parameters["alpha"]["1_1"],
-                                parameters["alpha"]["1_2"]],
-                               [0, 
-                                parameters["alpha"]["2_1"],
-                                parameters["alpha"]["2_2"]]]) #Poisson arrival rate (number of agents 
-                                                              #meeting in one unit of time)
+        columns = {"type": np.int8, "currency": np.int8, "nationality": np.int8}
+        if self.exit == "lifetime":
+            columns["birth"] = np.float64 #time of birth
         
+        self.agents = AgentStore(columns, capacity=self.nb)
+        
+        #agents of each nationality, for the matching
+        self.pools = MatchingPools(self.nb_countries, capacity=self.nb // self.nb_countries)
+        
+        #number of agents of each nationality (rows) holding each currency (columns)
+        self.counts = np.zeros((self.nb_countries + 1, self.nb_countries + 1), dtype=np.int64)
+
+        #Advantage of being a seller, buyer depending on the currency 
+        #(row 0 is unused so that nationalities index rows)
+        self.value = country_table(parameters["v"], self.nb_countries)
+        
+        #Poisson arrival rate (number of agents meeting in one unit of time),
+        #missing pairs of countries never meet
+        self.alpha = country_table(parameters["alpha"], self.nb_countries, default=0)
+        
+        #pairs of countries meeting, own country pairs first (1, 1), (2, 2), ..., 
+        #then other pairs in row order (1, 2), ..., (2, 1), ...
+        home = [(i, i) for i in range(1, self.nb_countries + 1) if self.alpha[i, i] > 0]
+        foreign = [(i, j) for i, j in zip(*np.nonzero(self.alpha)) if i != j]
+        self.pairs = np.array(home + foreign, dtype=np.int64).reshape(-1, 2)
+        self.nb_home_pairs = len(home)
+        
+
         self.set_up()
 
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def type(self):
+        """type of good each agent produces"""
+        return self.agents["type"]
+
+    @property
+    def currency(self):
+        """currency held by each agent (0 means no money)"""
+        return self.agents["currency"]
+
+    @property
+    def nationality(self):
+        return self.agents["nationality"]
+
+    @property
+    def exchange_list(self):
+        """agents who met during the tick, in order of meeting"""
+        return self.rewards["agent"]
+
     #-----------------------------------------------------------------------------------------#
     @property
     def equilibrium(self):
         """returns current equilibrium state""" 
         
-        cond = self.nationality != self.currency  #Check if one agent i holds money j =/= i
-        cond2 = self.currency != 0               #This currency has to be different from 0
-        match = cond * cond2
-        steady = self.steady_state[1] < 0.05
+        #Check if one agent i holds money j =/= i (different from 0)
+        foreign = self.counts.sum(axis=1) - self.counts[:, 0] - self.counts.diagonal()
+        steady = self.steady_state[1] < self.equilibrium_tol
         
-        return [(country in self.nationality[match]) * steady for country in [0, 1, 2]]
+        return [(foreign[country] > 0) * steady for country in range(self.nb_countries + 1)]
 
     #-----------------------------------------------------------------------------------------#
     def set_up(self):
         """fills nationality array and type array""" 
         
-        self.nationality = np.array(np.split(self.nationality, self.nb_countries))
+        nb_per_country = self.nb // self.nb_countries
         
-        self.type = np.array_split(self.nationality[0].copy(), self.nb_type)       #split arrays 
-        self.type = np.array([self.type for i in range(self.nb_countries)])        
+        for i in range(self.nb_countries):
+            self.agents.append(nb_per_country, nationality=i + 1, 
+                               type=self.split_types(nb_per_country))
+            self.counts[i + 1, 0] += nb_per_country
+        
+        #ages uniform over a lifetime, so that agents don't all leave together
+        if self.exit == "lifetime":
+            self.agents["birth"][:] = -self.streams["births"].integers(self.lifetime, 
+                                                                       size=len(self.agents))
+
+    #-----------------------------------------------------------------------------------------#
+    def split_types(self, n):
+        """returns types of n agents split in nb_type contiguous groups
+        (same sizes as np.array_split)"""
         
-        for i in range(self.nb_countries):                                    #fill arrays with
-            self.nationality[i][:]= i + 1
-            for j in range(self.nb_type):
-                self.type[i][j][:] = j
+        sizes = [n // self.nb_type + (t < n % self.nb_type) for t in range(self.nb_type)]
         
-        for i in range(self.nb_countries):
-            self.type = np.concatenate([i for i in self.type])              #concatenate both of them 
-                                                                            #in order to get two    
-        self.nationality = np.concatenate([i for i in self.nationality])    #singles array without
+        return np.repeat(np.arange(self.nb_type, dtype=np.int8), sizes)
 
     #-----------------------------------------------------------------------------------------#
     def increase_population(self):
-        """returns N = nb of country arrays of newborn agents"""
+        """returns N = nb of country arrays of newborn agents: growth * nb newborns
+        split between countries, or with exits one per agent leaving its country
+        (agents leaving are removed here)"""
+        
+        if self.exit is not None:
+            self.pools.sync(self.nationality)
+            leaving = self.exiting_agents()
+            nationality = self.nationality[leaving]
+            
+            np.add.at(self.counts, (nationality, self.currency[leaving]), -1)
+            self.pools.remove(leaving, nationality - 1)
+            moved, slots = self.agents.remove(leaving)
+            self.pools.move(moved, slots, self.nationality[slots] - 1)
+            
+            return [np.zeros(n, dtype=np.int8) 
+                    for n in np.bincount(nationality, minlength=self.nb_countries + 1)[1:]]
     
-        nb_newborn = int(self.growth * self.nb)
+        nb_newborn = int(self.growth * self.tick * self.nb)
         nb_newborn_per_country =  int(nb_newborn / self.nb_countries)
         self.nb += nb_newborn_per_country * self.nb_countries
 
-        newborn = np.array([np.zeros(nb_newborn_per_country)
-                   for i in range(self.nb_countries)])
+        newborn = np.zeros((self.nb_countries, nb_newborn_per_country), dtype=np.int8)
         
         return newborn 
+    
+    #-----------------------------------------------------------------------------------------#
+    def exiting_agents(self):
+        """indices of agents leaving the economy this tick"""
+        
+        if self.exit == "hazard":
+            rng = self.streams["births"]
+            leaving = rng.binomial(len(self.agents), min(self.growth * self.tick, 1.))
+            return rng.choice(len(self.agents), leaving, replace=False)
+        
+        return np.flatnonzero(self.time - self.agents["birth"] >= self.lifetime)
+    
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def turnover(self):
+        """share of the population born each unit of time 
+        (and leaving it, with exits)"""
+        
+        return 1. / self.lifetime if self.exit == "lifetime" else self.growth
         
     #-----------------------------------------------------------------------------------------#
     def inject_money(self, newborn):
@@ -117,146 +331,236 @@ class Economy(object):
         which has a part of currency holders in it.
         """
         
-        fraction = [int(len(newborn[0]) * self.money[i]) for i in [1, 2]]
-
         for i in range(len(newborn)):
-            newborn[i][0:fraction[i]] = i + 1
+            newborn[i][0:int(len(newborn[i]) * self.money[i + 1])] = i + 1
         
         return newborn 
     
     #-----------------------------------------------------------------------------------------#
     def add_types(self, newborn):
-        """defines types of newborn citizens"""
+        """defines types of newborn citizens 
+        (uniform with exits, since few agents are born each tick)"""
         
-        types = np.array_split(newborn[0], self.nb_type)
-        types = np.array([types for i in range(self.nb_countries)])
+        start = len(self.agents) - sum(len(i) for i in newborn)
         
-        for country in range(len(types)):
-            for idx in range(self.nb_type):
-                types[country][idx][:] = idx
-                self.type = np.append(self.type, types[country][idx])
+        for country in range(len(newborn)):
+            end = start + len(newborn[country])
+            self.type[start:end] = self.split_types(end - start) if self.exit is None else \
+                                   self.streams["births"].integers(self.nb_type, size=end - start)
+            start = end
         
-        assert self.nb == len(self.currency) == len(self.nationality) == len(self.type)
-        assert len(np.where(self.type == 0)) ==  len(np.where(self.type == 1)) \
-               == len(np.where(self.type == 2)) 
+        assert self.nb == len(self.agents)
 
     #-----------------------------------------------------------------------------------------#
     def add_newborn(self, newborn):
         """add newborn citizen to population"""
         
         for i in range(len(newborn)):
-            currency = np.array(newborn[i])
-            np.random.shuffle(currency)
-            self.currency = np.append(self.currency, currency)
-            newborn[i].fill(i + 1)
-            self.nationality = np.append(self.nationality, newborn[i])
-            self.reward = np.append(self.reward, np.zeros(len(newborn[i]), dtype=object))
-        
-        assert len(np.where(self.currency == 0)) ==  len(np.where(currency == 1)) 
-        assert len(np.where(self.nationality == 1)) == len(np.where(self.nationality == 2)) 
+            currency = self.streams["money"].permutation(newborn[i])
+            self.agents.append(len(currency), currency=currency, nationality=i + 1, birth=self.time)
+            self.counts[i + 1] += np.bincount(currency, minlength=self.nb_countries + 1)
+        
     #-----------------------------------------------------------------------------------------#
     def get_sellers_and_buyers(self):
-        """get the two separates groups in order 
-        to make them encounter later"""
+        """get the separate groups of each country in order 
+        to make them encounter later: pools get newborns and every agent
+        is available again for the tick. Returns views of the members of each pool 
+        (in order of index, unless agents left or were drawn)"""
         
-        nationality_i = self.nationality == 1
-        nationality_j = self.nationality == 2
-
-        #get idx for true statements
-        nationality_i_idx = list(compress(range(len(nationality_i)), nationality_i))
-        nationality_j_idx = list(compress(range(len(nationality_j)), nationality_j))
+        self.pools.sync(self.nationality)
+        self.pools.reset()
+        pools = [self.pools[i] for i in range(self.nb_countries)]
         
-        assert len(nationality_i_idx) == len(nationality_j_idx)
+        assert len(set(len(pool) for pool in pools)) == 1
         
-        return [nationality_i_idx, nationality_j_idx]
+        return pools
     
     #-----------------------------------------------------------------------------------------#
     def poisson_distribution(self):
         """returns number of meeting for ij, ii randomly 
         picked in a poisson distribution 
-        based on population sample and average arrival rate"""
+        based on average arrival rate.
+        Counts are read from a schedule of SCHEDULE_BLOCK ticks (see meeting_schedule),
+        drawn again when used up or when the tick changes"""
+        
+        if not len(self.schedule) or self.schedule_tick != self.tick:
+            self.schedule = self.meeting_schedule(SCHEDULE_BLOCK)
+            self.schedule_tick = self.tick
+        
+        counts, self.schedule = self.schedule[0], self.schedule[1:]
+        
+        return self.meeting_dict(counts)
+    
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def meeting_rates(self):
+        """poisson means of the number of meeting in one unit of time
+        for pairs of countries in self.pairs ((1, 1), (2, 2), (1, 2), (2, 1) for two countries)"""
+        
+        return self.alpha[self.pairs[:, 0], self.pairs[:, 1]] * self.nb_type
+    
+    #-----------------------------------------------------------------------------------------#
+    def meeting_schedule(self, n_steps, n_replicas=None):
+        """pre-generates number of meeting for a whole run.
+        Returns an int32 array of shape (n_steps, pairs), or (n_replicas, n_steps, pairs),
+        columns being ordered as in meeting_rates"""
         
-        nb_of_meeting_ii = []
-        nb_of_meeting_ij = []
+        shape = (n_steps, len(self.pairs)) if n_replicas is None \
+                else (n_replicas, n_steps, len(self.pairs))
         
-        #randomly select an ii number of meeting from poisson distribution
-        for i in [1, 2]:
-            array = np.random.poisson(self.alpha[i, i] * self.nb_type, self.nb)
-            nb_of_meeting_ii.append(np.random.choice(array))
+        return self.streams["meetings"].poisson(self.meeting_rates * self.tick, 
+                                                shape).astype(np.int32)
+    
+    #-----------------------------------------------------------------------------------------#
+    def meeting_dict(self, counts):
+        """converts one row of meeting counts to the dict 
+        used by main_agents_random_matching (own country pairs, other pairs)"""
         
-        #randomly select an ij number of meeting from poisson distribution
-        for i in [(1, 2), (2, 1)]:
-            array = np.random.poisson(self.alpha[i[0], i[1]] * self.nb_type, self.nb)
-            nb_of_meeting_ij.append(np.random.choice(array))
+        counts = [int(i) for i in counts]
         
-        return {"ii": nb_of_meeting_ii, "ij": nb_of_meeting_ij}
+        return {"ii": counts[:self.nb_home_pairs], "ij": counts[self.nb_home_pairs:]}
     
     #-----------------------------------------------------------------------------------------#
     def main_agents_random_matching(self, nationality, meeting_dict):
         
+        if self.matching == "batched":
+            return self.batched_agents_random_matching(nationality, meeting_dict)
+        
+        home_pairs = self.pairs[:self.nb_home_pairs] - 1
+        foreign_pairs = np.sort(self.pairs[self.nb_home_pairs:] - 1, axis=1)
+        
+        #draws of the whole tick at once
+        draws = self.streams["matching"].random(
+                    (sum(meeting_dict["ii"]) + sum(meeting_dict["ij"]), 2)).tolist()
+        start = 0
+        
         #ii matching 
-        for i, number_of_meeting in enumerate(meeting_dict["ii"]):
-            nationality[i] = self.agents_random_matching(nationality[i], 
-                                                         nationality[i],
-                                                         number_of_meeting)[0]
-        #ij matching
-        for number_of_meeting in meeting_dict["ij"]:
-            nationality[0], nationality[1] = self.agents_random_matching(nationality[0], 
-                                                                         nationality[1],
-                                                                         number_of_meeting)
+        for (i, _), number_of_meeting in zip(home_pairs, meeting_dict["ii"]):
+            self.agents_random_matching(i, i, number_of_meeting, 
+                                        draws[start:start + number_of_meeting])
+            start += number_of_meeting
+        
+        #ij matching (agent of the first country drawn first)
+        for (i, j), number_of_meeting in zip(foreign_pairs, meeting_dict["ij"]):
+            self.agents_random_matching(i, j, number_of_meeting, 
+                                        draws[start:start + number_of_meeting])
+            start += number_of_meeting
     #-----------------------------------------------------------------------------------------#
-    def agents_random_matching(self, nationality_1, nationality_2, number_of_meeting):
-        """match agent using array of country 1 and country 2 and number of meeting.
-        Returns nationality list without picked index"""
+    def agents_random_matching(self, pool_1, pool_2, number_of_meeting, draws=None):
+        """match agents of pools pool_1 and pool_2 (country - 1) number_of_meeting times,
+        while both have more than one available agent.
+        draws are two uniform numbers per meeting (drawn here if None)"""
+        
+        if draws is None:
+            draws = self.streams["matching"].random((number_of_meeting, 2)).tolist()
+        
+        pools = self.pools
+        first, second = [], []
         
         #for number of meeting 
         for i in range(number_of_meeting):
-            if len(nationality_1) > 1 and len(nationality_2) > 1:
-                
-                #we picks randoms idx and then remove them
-                idx_1 = np.random.randint(len(nationality_1))
-                agent_idx_1 = nationality_1[idx_1]
-                nationality_1.pop(idx_1)
+            if pools.available[pool_1] > 1 and pools.available[pool_2] > 1:
                 
-                idx_2 = np.random.randint(len(nationality_2))
-                agent_idx_2 = nationality_2[idx_2]
-                nationality_2.pop(idx_2)
-                
-                check = [self.currency[idx_1], self.currency[idx_2]]
-                buyer_and_seller = (0 in check) and (1 in check or 2 in check)
-
-                if buyer_and_seller:
-                    
-                    #find idx of != 0 in check list (meaning buyer)
-                    buyer = list(compress(range(len(check)), check))[0]
-                    buyer_idx = (idx_1, idx_2)[buyer]
-                    
-                    self.exchange_list.append(buyer_idx)
-                    #find idx of 0 in check list (meaning seller)
-                    seller = check.index(0)
-                    seller_idx = (idx_1, idx_2)[seller]
-                    
-                    self.exchange_list.append(seller_idx)
-                    
-                    self.make_choice_and_exchange(buyer_idx, seller_idx) 
-            
-        return (nationality_1, nationality_2)
+                #drawn agents are not available until the next tick
+                first.append(pools.draw(pool_1, draws[i][0]))
+                second.append(pools.draw(pool_2, draws[i][1]))
+        
+        #an agent meets at most once per tick, so exchanges can be made after the draws
+        self.meet_pairs(np.array(first, dtype=np.int64), np.array(second, dtype=np.int64))
      
-   #-----------------------------------------------------------------------------------------#
+    #-----------------------------------------------------------------------------------------#
+    def batched_agents_random_matching(self, nationality, meeting_dict):
+        """draws all ii and ij pairs of the tick at once (without replacement)
+        and makes every exchange with array operations.
+        Same meeting rules as agents_random_matching"""
+        
+        pools = [self.streams["matching"].permutation(pool) for pool in nationality]
+        first, second = [], []
+        home_pairs = self.pairs[:self.nb_home_pairs] - 1
+        foreign_pairs = np.sort(self.pairs[self.nb_home_pairs:] - 1, axis=1)
+        
+        #ii matching: consecutive blocks of the same shuffled pool
+        for (i, _), number_of_meeting in zip(home_pairs, meeting_dict["ii"]):
+            k = min(number_of_meeting, len(pools[i]) // 2)
+            first.append(pools[i][:k])
+            second.append(pools[i][k:2 * k])
+            pools[i] = pools[i][2 * k:]
+        
+        #ij matching: next remaining agents of both pools
+        for (i, j), number_of_meeting in zip(foreign_pairs, meeting_dict["ij"]):
+            k = min(number_of_meeting, max(min(len(pools[i]), len(pools[j])) - 1, 0))
+            first.append(pools[i][:k])
+            second.append(pools[j][:k])
+            pools[i] = pools[i][k:]
+            pools[j] = pools[j][k:]
+        
+        self.meet_pairs(np.concatenate(first), np.concatenate(second))
+    
+    #-----------------------------------------------------------------------------------------#
+    def meet_pairs(self, first, second):
+        """agents first[k] and second[k] meet (each agent appears at most once),
+        pairs of a buyer and a seller make their choices and exchanges"""
+        
+        if self.profiler is not None:
+            self.profiler.count("meetings", len(first))
+        
+        #one agent holds money, the other doesn't
+        first_currency = self.currency[first]
+        second_currency = self.currency[second]
+        buyer_and_seller = (first_currency == 0) != (second_currency == 0)
+        
+        first_is_buyer = first_currency != 0
+        buyer_idx = np.where(first_is_buyer, first, second)[buyer_and_seller]
+        seller_idx = np.where(first_is_buyer, second, first)[buyer_and_seller]
+        
+        self.make_choices_and_exchanges(buyer_idx, seller_idx)
+    
+    #-----------------------------------------------------------------------------------------#
+    def make_choices_and_exchanges(self, buyer_idx, seller_idx):
+        """exchange or not, for arrays of buyers and sellers 
+        (each agent appears at most once), with the exchange kernel"""
+        
+        if self.exchange_kernel is None:
+            for buyer, seller in zip(buyer_idx.tolist(), seller_idx.tolist()):
+                self.make_choice_and_exchange(buyer, seller)
+            return
+        
+        buyer_currency, buyer_acceptance, seller_acceptance = self.exchange_kernel(
+            buyer_idx, seller_idx, self.nationality, self.type, self.currency, self.value, 
+            self.switch_type_array, self.c, self.counts)
+        
+        exchange = buyer_acceptance & seller_acceptance
+        
+        if self.profiler is not None:
+            ii = self.nationality[buyer_idx] == self.nationality[seller_idx]
+            self.profiler.count("trades", exchange.sum())
+            self.profiler.count("trades_ii", (exchange & ii).sum())
+            self.profiler.count("trades_ij", (exchange & ~ii).sum())
+            self.profiler.count("buyer_rejections", len(exchange) - buyer_acceptance.sum())
+            self.profiler.count("seller_rejections", len(exchange) - seller_acceptance.sum())
+        
+        self.rewards.add(buyer_idx, exchange, buyer_currency)
+        self.rewards.add(seller_idx, exchange * 0.5, 0)
+     
+    #-----------------------------------------------------------------------------------------#
     def make_choice_and_exchange(self, buyer_idx, seller_idx):
         """exchange or not"""
 
-        seller_nationality = int(self.nationality[seller_idx])
-        buyer_nationality =  int(self.nationality[buyer_idx])
+        #int8 columns index value and counts directly
+        columns = self.agents.columns
+        nationality, kind, currency = columns["nationality"], columns["type"], columns["currency"]
+        
+        seller_nationality = nationality[seller_idx]
+        buyer_nationality = nationality[buyer_idx]
         
-        seller_type = int(self.type[seller_idx])
-        buyer_type = int(self.type[buyer_idx])
+        seller_type = kind[seller_idx]
+        buyer_type = kind[buyer_idx]
         
-        buyer_currency = int(self.currency[buyer_idx])
-        seller_currency = int(self.currency[seller_idx])
+        buyer_currency = currency[buyer_idx]
+        seller_currency = currency[seller_idx]
         
         #check if sellers products the good the buyer consumes
-        buyer_acceptance = buyer_type == self.switch_type[seller_type]
+        buyer_acceptance = buyer_type == self.switch_type_array[seller_type]
         
         #check if it's an ii exchange or an ij exchange, if ii the seller
         #accepts directly
@@ -268,112 +572,194 @@ class Economy(object):
             seller_acceptance = (self.value[seller_nationality, buyer_currency]
                                 - self.c) > self.value[seller_nationality, 0]
         
+        if self.profiler is not None:
+            exchange = buyer_acceptance and seller_acceptance
+            self.profiler.count("trades", exchange)
+            self.profiler.count("trades_ii" if buyer_nationality == seller_nationality 
+                                else "trades_ij", exchange)
+            self.profiler.count("buyer_rejections", not buyer_acceptance)
+            self.profiler.count("seller_rejections", not seller_acceptance)
+        
         if buyer_acceptance and seller_acceptance:
-            self.reward[buyer_idx] = (1, buyer_currency)
-            self.reward[seller_idx] = (0.5, 0)
+            self.rewards.add(buyer_idx, 1, buyer_currency)
+            self.rewards.add(seller_idx, 0.5, 0)
+            
+            currency[buyer_idx], currency[seller_idx] = seller_currency, buyer_currency
             
-            self.currency[buyer_idx], self.currency[seller_idx] = \
-            seller_currency, buyer_currency
+            self.counts[buyer_nationality, buyer_currency] -= 1
+            self.counts[buyer_nationality, seller_currency] += 1
+            self.counts[seller_nationality, seller_currency] -= 1
+            self.counts[seller_nationality, buyer_currency] += 1
 
         else:
-            self.reward[buyer_idx] = (0, buyer_currency)
-            self.reward[seller_idx] = (0, 0)
+            self.rewards.add(buyer_idx, 0, buyer_currency)
+            self.rewards.add(seller_idx, 0, 0)
 
 #-----------------------------------------------------------------------------------------#
     def update_values(self):
-        for idx in self.exchange_list:
-            self.value[self.nationality[idx], self.reward[idx][1]] += \
-                    self.learn * (self.reward[idx][0] 
-                    - self.value[self.nationality[idx], self.reward[idx][1]])
+        """moves value of each (nationality, currency) cell with the value rule
+        (see learning.ValueRule), given rewards of the tick"""
+        
+        aggregate = None
+        
+        if self.value_rule.uses_rewards and len(self.rewards):
+            cells = self.nationality[self.rewards["agent"]].astype(np.int64) \
+                    * self.value.shape[1] + self.rewards["currency"]
+            aggregate = self.value_rule.aggregate(cells, self.rewards["reward"], self.value.size)
+        
+        self.value_rule.update(self, aggregate)
 
     def get_steady_state(self):
+        """residual of the steady state equation of the share m_ii of agents of country i 
+        holding their own currency: sum over countries j meeting i of
+        alpha_ij * (m_i0 * m_ji - m_ii * m_j0 * equilibrium_j) + turnover * (money_i - m_ii)"""
+        
+        shares = self.counts / self.nb
+        equilibrium = np.array(self.equilibrium, dtype=float)
+        i, j = self.pairs[self.nb_home_pairs:].T
+        home = np.arange(self.nb_countries + 1)
+        
+        #check if steady state equation is statisfied 
+        flows = self.alpha[i, j] * (shares[i, 0] * shares[j, i] 
+                                    - shares[i, i] * shares[j, 0] * equilibrium[j])
+        residual = np.bincount(i, weights=flows, minlength=self.nb_countries + 1) \
+                   + self.turnover * (self.money - shares[home, home])
+        
+        self.steady_state[1:] = residual[1:].tolist()
+                                        
+    #-----------------------------------------------------------------------------------------#
+    def step(self):
+        """one tick: newborns arrive, agents meet and learn"""
         
-        for country in [1, 2]:
-            cond_mii  = (self.nationality == self.currency)\
-                        * (self.currency != 0)*(self.nationality == country)
+        if self.profiler is None:
+            stage = run_stage
+        else:
+            stage = self.profiler.stage
+            self.profiler.start_tick(self.t)
+        
+        newborn = stage("increase_population", self.increase_population)
+        newborn = stage("inject_money", self.inject_money, newborn)
+        stage("add_newborn", self.add_newborn, newborn)
+        stage("add_types", self.add_types, newborn)
+        population = stage("get_sellers_and_buyers", self.get_sellers_and_buyers)
+        nb_of_meeting = stage("poisson_distribution", self.poisson_distribution)
+        stage("main_agents_random_matching", self.main_agents_random_matching, 
+              population, nb_of_meeting)
+        stage("update_values", self.update_values)
+        stage("get_steady_state", self.get_steady_state)
+        
+        if self.profiler is not None:
+            self.profiler.count("exchange_list", len(self.rewards))
+            self.profiler.end_tick()
+        
+        self.rewards.clear()
+        self.time += self.tick
+        self.t += 1
 
-            cond_mij  = (self.currency != self.nationality)*(self.currency != 0)\
-                        * (self.nationality == country)
-            
-            cond_mi0  = (self.currency != self.nationality)*(self.currency == 0)\
-                        * (self.nationality == country)
+    #-----------------------------------------------------------------------------------------#
+    def enable_profiling(self, capacity=4096, track_allocations=False):
+        """starts recording stage timings and meeting counters of each step
+        (last capacity steps are kept), returns the Profiler"""
+        
+        self.profiler = Profiler(capacity, track_allocations)
+        
+        return self.profiler
+
+    #-----------------------------------------------------------------------------------------#
+    def disable_profiling(self):
+        
+        if self.profiler is not None:
+            self.profiler.close()
+        self.profiler = None
+
+    #-----------------------------------------------------------------------------------------#
+    def run(self, n_steps=None, tol=None, record_every=1, time_budget=None,
+            checkpoint_every=None, checkpoint_path=None, sink=None, monitor=None, cache=None):
+        """runs without printing until a step, time or convergence budget 
+        is reached (see runner.run), returns a RunResult"""
+        
+        return runner.run(self, n_steps=n_steps, tol=tol, 
+                          record_every=record_every, time_budget=time_budget,
+                          checkpoint_every=checkpoint_every, checkpoint_path=checkpoint_path,
+                          sink=sink, monitor=monitor, cache=cache)
+
+    #-----------------------------------------------------------------------------------------#
+    def save_checkpoint(self, path):
+        """writes the full state (agent columns, values, counters and 
+        random streams states) to path as a .npz of raw arrays.
+        The file is replaced atomically"""
+        
+        streams = {name: rng.bit_generator.state for name, rng in self.streams.items()}
+        seed = (self.seed_sequence.entropy, self.seed_sequence.spawn_key,
+                self.seed_sequence.pool_size)
+        self.pools.sync(self.nationality)
+        
+        state = {"parameters": np.frombuffer(pickle.dumps(self.parameters), dtype=np.uint8),
+                 "seed": np.frombuffer(pickle.dumps(seed), dtype=np.uint8),
+                 "streams": np.frombuffer(pickle.dumps(streams), dtype=np.uint8),
+                 "t": self.t,
+                 "time": self.time,
+                 "tick": self.tick,
+                 "schedule": self.schedule,
+                 "schedule_tick": self.schedule_tick,
+                 "nb": self.nb,
+                 "value": self.value,
+                 "alpha": self.alpha,
+                 "steady_state": np.array(self.steady_state, dtype=float),
+                 "counts": self.counts,
+                 "pool_sizes": np.array(self.pools.sizes),
+                 "pool_members": np.concatenate([self.pools[i] 
+                                                 for i in range(self.nb_countries)])}
+        
+        for name in self.agents.columns:
+            state["agents_" + name] = self.agents[name]
+        
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **state)
+        os.replace(path + ".tmp", path)
+
+    #-----------------------------------------------------------------------------------------#
+    @classmethod
+    def load_checkpoint(cls, path):
+        """returns the economy saved in path by save_checkpoint and restores
+        its seed and the random streams states, so the run continues as if uninterrupted"""
+        
+        with np.load(path) as state:
+            parameters = pickle.loads(state["parameters"].tobytes())
+            entropy, spawn_key, pool_size = pickle.loads(state["seed"].tobytes())
+            seed = np.random.SeedSequence(entropy, spawn_key=spawn_key, pool_size=pool_size)
             
-            cond_mji = (self.currency != self.nationality)*(self.currency != 0)\
-                        * (self.nationality == self.switch_country[country])
+            economy = cls(dict(parameters, nb=0), seed)
+            economy.parameters = parameters
+            economy.nb = int(state["nb"])
+            economy.t = int(state["t"])
+            economy.time = float(state["time"])
+            economy.tick = float(state["tick"])
+            economy.schedule = state["schedule"]
+            economy.schedule_tick = float(state["schedule_tick"])
+            economy.agents.append(economy.nb, **{name: state["agents_" + name] 
+                                                 for name in economy.agents.columns})
+            economy.value[:] = state["value"]
+            economy.alpha[:] = state["alpha"]
+            economy.steady_state = list(state["steady_state"])
+            economy.counts[:] = state["counts"]
             
-            cond_mjj = (self.nationality == self.currency)*(self.currency != 0)\
-                       * (self.nationality == self.switch_country[country])
+            #members in saved order, which draws depend on
+            members = np.split(state["pool_members"], np.cumsum(state["pool_sizes"])[:-1])
+            for pool, agents in enumerate(members):
+                economy.pools.add(pool, agents)
+            economy.pools.nb_agents = economy.nb
             
-            cond_mj0 =  (self.currency != self.nationality)*(self.currency == 0)\
-                        * (self.nationality == self.switch_country[country])
-
-            mii = len(self.currency[cond_mii]) / self.nb
-            mij = len(self.currency[cond_mij]) / self.nb
-            mi0 = len(self.currency[cond_mi0]) / self.nb
-            mji = len(self.currency[cond_mji]) / self.nb
-            mjj = len(self.currency[cond_mjj]) / self.nb
-            mj0 = len(self.currency[cond_mj0]) / self.nb
-                
-                                
-            #check if steady state equation is statisfied 
-            self.steady_state[country] = ((self.alpha[country, self.switch_country[country]]
-                                             * mi0
-                                             * mji)
-                                             - (self.alpha[country, self.switch_country[country]]
-                                             * mii
-                                             * mj0
-                                             * self.equilibrium[self.switch_country[country]])
-                                             + self.growth
-                                             * (self.money[country]
-                                             - mii))
-                                        
+            for name, stream_state in pickle.loads(state["streams"].tobytes()).items():
+                economy.streams[name].bit_generator.state = stream_state
+        
+        return economy
+
   #-----------------------------------------------------------------------------------------#
     @staticmethod
-    def main():
-    
-        parameters = { "c": 0.01,
-                   "u": 0.2,
-                   "r": 0.1,
-                   "money": {1: 0.9,
-                             2: 0.9
-                             },
-                   "alpha": {"1_1": 8,
-                             "1_2": 9,
-                             "2_1": 9,
-                             "2_2": 8
-                             },
-                   "v": { "1_0": 0.5,
-                          "1_1": 0.5,
-                          "1_2": 0.5,
-                          "2_0": 0.5,
-                          "2_1": 0.5,
-                          "2_2": 0.5
-                             },
-                   "nb_type": 3,
-                   "nb_countries": 2,
-                   "nb": 400,
-                   "growth": 0.02
-                }
+    def main(argv=None):
     
-        Eco = Economy(parameters)
-        i = 0
-        while True: 
-            newborn = Eco.increase_population()
-            newborn = Eco.inject_money(newborn)
-            Eco.add_newborn(newborn)
-            Eco.add_types(newborn)
-            population = Eco.get_sellers_and_buyers()
-            nb_of_meeting = Eco.poisson_distribution()
-            Eco.main_agents_random_matching(population, nb_of_meeting)
-            Eco.update_values()
-            Eco.get_steady_state()
-            Eco.exchange_list = []
-            print(Eco.value)
-            print(Eco.equilibrium)
-            print(Eco.steady_state)
-            # i += 1
-            # if i > 50:
-                # import pdb; pdb.set_trace()
+        return runner.main(Economy, PARAMETERS, argv)
             
 if __name__ == '__main__':
     Economy.main()
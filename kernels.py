@@ -0,0 +1,88 @@
+#coding=utf8
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+#-----------------------------------------------------------------------------------------#
+def exchange_numpy(buyers, sellers, nationality, kind, currency, value, switch_type, c, counts):
+    """exchanges of the meetings of buyers[k] (holding money) and sellers[k] (without money),
+    each agent appearing at most once: the buyer accepts if the seller produces the type
+    it consumes (switch_type), the seller accepts its own currency, or a foreign one if
+    value[seller nationality, currency] - c > value[seller nationality, 0].
+    Updates currency and counts in place.
+    Returns (buyer currency before exchange, buyer acceptance, seller acceptance)"""
+
+    seller_nationality = nationality[sellers]
+    buyer_currency = currency[buyers]
+
+    buyer_acceptance = kind[buyers] == switch_type[kind[sellers]]
+
+    seller_acceptance = (buyer_currency == seller_nationality) \
+                        | ((value[seller_nationality, buyer_currency] - c)
+                           > value[seller_nationality, 0])
+
+    exchange = buyer_acceptance & seller_acceptance
+
+    currency[sellers[exchange]] = buyer_currency[exchange]
+    currency[buyers[exchange]] = 0
+
+    np.add.at(counts, (nationality[buyers[exchange]], buyer_currency[exchange]), -1)
+    np.add.at(counts, (nationality[buyers[exchange]], 0), 1)
+    np.add.at(counts, (seller_nationality[exchange], 0), -1)
+    np.add.at(counts, (seller_nationality[exchange], buyer_currency[exchange]), 1)
+
+    return buyer_currency, buyer_acceptance, seller_acceptance
+
+#-----------------------------------------------------------------------------------------#
+def exchange_loop(buyers, sellers, nationality, kind, currency, value, switch_type, c, counts,
+                  buyer_currency, buyer_acceptance, seller_acceptance):
+    """same rules as exchange_numpy one meeting at a time, filling the three output arrays
+    (compiled by numba for exchange_numba)"""
+
+    for k in range(len(buyers)):
+        buyer, seller = buyers[k], sellers[k]
+        i, m = nationality[seller], currency[buyer]
+
+        buyer_currency[k] = m
+        buyer_acceptance[k] = kind[buyer] == switch_type[kind[seller]]
+        seller_acceptance[k] = m == i or value[i, m] - c > value[i, 0]
+
+        if buyer_acceptance[k] and seller_acceptance[k]:
+            currency[seller] = m
+            currency[buyer] = 0
+
+            counts[nationality[buyer], m] -= 1
+            counts[nationality[buyer], 0] += 1
+            counts[i, 0] -= 1
+            counts[i, m] += 1
+
+compiled_exchange_loop = None if numba is None else numba.njit(cache=True)(exchange_loop)
+
+#-----------------------------------------------------------------------------------------#
+def exchange_numba(buyers, sellers, nationality, kind, currency, value, switch_type, c, counts):
+    """exchange_numpy compiled with numba"""
+
+    n = len(buyers)
+    buyer_currency = np.empty(n, dtype=currency.dtype)
+    buyer_acceptance = np.empty(n, dtype=bool)
+    seller_acceptance = np.empty(n, dtype=bool)
+
+    compiled_exchange_loop(buyers, sellers, nationality, kind, currency, value, switch_type,
+                           float(c), counts, buyer_currency, buyer_acceptance, seller_acceptance)
+
+    return buyer_currency, buyer_acceptance, seller_acceptance
+
+#-----------------------------------------------------------------------------------------#
+def exchange_kernel(name="numpy"):
+    """returns the exchange function of backend name: "numpy" or "numba" (needs numba)"""
+
+    assert name in ("numpy", "numba")
+
+    if name == "numba" and numba is None:
+        raise ImportError("the numba exchange kernel needs numba to be installed")
+
+    return exchange_numpy if name == "numpy" else exchange_numba
@@ -0,0 +1,165 @@
+#coding=utf8
+import numpy as np
+
+
+
+#-----------------------------------------------------------------------------------------#
+def reward_aggregate(cells, reward, learn, size, value_update="sequential"):
+    """returns (count, total) of rewards by cell (size cells), reward k being earned 
+    by cell cells[k]. total is the sum of rewards for "mean", the sum of 
+    learn * (1 - learn) ** (number of later rewards of the cell) * reward for "sequential" """
+    
+    reward = np.asarray(reward, dtype=float)
+    count = np.bincount(cells, minlength=size)
+    
+    if value_update == "mean":
+        return count, np.bincount(cells, weights=reward, minlength=size)
+    
+    #number of later rewards in the same cell gives the weight of a reward
+    order = np.argsort(cells, kind="stable")
+    start = np.cumsum(count) - count
+    later = np.empty(len(cells), dtype=np.int64)
+    later[order] = count[cells[order]] - 1 - (np.arange(len(cells)) - start[cells[order]])
+    
+    weights = learn * (1 - learn) ** later
+    
+    return count, np.bincount(cells, weights=weights * reward, minlength=size)
+
+#-----------------------------------------------------------------------------------------#
+def merge_reward_aggregates(aggregates, learn, value_update="sequential"):
+    """(count, total) of the rewards of several reward_aggregate, in order"""
+    
+    count, total = aggregates[0]
+    
+    for other_count, other_total in aggregates[1:]:
+        if value_update != "mean":
+            total = total * (1 - learn) ** other_count
+        count, total = count + other_count, total + other_total
+    
+    return count, total
+
+#-----------------------------------------------------------------------------------------#
+def apply_reward_aggregate(value, count, total, learn, value_update="sequential"):
+    """moves flat value array in place towards rewards of a reward_aggregate"""
+    
+    if value_update == "mean":
+        met = count > 0
+        value[met] += learn * (total[met] / count[met] - value[met])
+    
+    else:
+        value *= (1 - learn) ** count
+        value += total
+
+
+#-----------------------------------------------------------------------------------------#
+def sigmoid(x):
+    
+    return 1 / (1 + np.exp(-x))
+
+
+class ValueRule(object):
+    """
+    How values of (nationality, currency) cells evolve, once per tick after the matching.
+    update(economy, aggregate) moves economy.value in place from aggregated statistics:
+    the (count, total) reward aggregate of the tick (see reward_aggregate) for rules 
+    using rewards, None otherwise, and the economy's counts and equilibrium.
+    Arrays of the economy may have a leading replica axis (BatchedEconomy).
+    Engines call aggregate on the rewards of the tick (merge to combine 
+    aggregates of parts of the tick, in order) only if uses_rewards.
+    """
+    
+    uses_rewards = False
+    
+    #-----------------------------------------------------------------------------------------#
+    def aggregate(self, cells, reward, size):
+        
+        return None
+    
+    #-----------------------------------------------------------------------------------------#
+    def merge(self, aggregates):
+        
+        return None
+    
+    #-----------------------------------------------------------------------------------------#
+    def update(self, economy, aggregate=None):
+        
+        raise NotImplementedError
+
+
+class Reinforcement(ValueRule):
+    """
+    Values move towards the rewards earned by agents of the cell
+    with learning rate learn, mode "sequential" (same as value += learn * (reward - value)
+    for each reward in order) or "mean" (a single such step towards the mean reward).
+    """
+    
+    uses_rewards = True
+    
+    def __init__(self, learn=0.5, mode="sequential"):
+        
+        assert mode in ("sequential", "mean")
+        
+        self.learn = learn
+        self.mode = mode
+    
+    #-----------------------------------------------------------------------------------------#
+    def aggregate(self, cells, reward, size):
+        
+        return reward_aggregate(cells, reward, self.learn, size, self.mode)
+    
+    #-----------------------------------------------------------------------------------------#
+    def merge(self, aggregates):
+        
+        return merge_reward_aggregates(aggregates, self.learn, self.mode)
+    
+    #-----------------------------------------------------------------------------------------#
+    def update(self, economy, aggregate=None):
+        
+        if aggregate is not None:
+            apply_reward_aggregate(economy.value.reshape(-1), *aggregate, 
+                                   learn=self.learn, value_update=self.mode)
+
+
+class SigmoidBellman(ValueRule):
+    """
+    Matsumaya1993 rule: values are the sigmoid of r times the right hand side of 
+    their Bellman equation at current shares m_kc (counts / nb), seller values first:
+    v_i0 = sigmoid(r * sum over c of accepts_i(c) * sum over k of alpha_ik m_kc * (v_ic - v_i0 - c))
+    v_ic = sigmoid(r * sum over k of alpha_ik m_k0 accepts_k(c) * (u + v_i0 - v_ic))
+    sellers accepting their own currency, and foreign currency if their country is
+    in equilibrium.
+    """
+    
+    #-----------------------------------------------------------------------------------------#
+    def update(self, economy, aggregate=None):
+        
+        n = economy.nb_countries + 1
+        value = economy.value
+        shares = economy.counts / economy.nb
+        
+        #accept[..., k, c]: sellers of k accept currency c
+        equilibrium = np.asarray(economy.equilibrium, dtype=bool)
+        accept = np.repeat(equilibrium[..., :, None], n, axis=-1)
+        accept[..., range(n), range(n)] = True
+        accept[..., 0] = False
+        
+        #sellers of i meeting buyers holding c, buyers of i meeting sellers accepting c
+        buyers = np.matmul(economy.alpha, shares) * accept
+        sellers = np.matmul(economy.alpha, shares[..., :, :1] * accept)
+        
+        gain = (buyers[..., 1:, 1:] * (value[..., 1:, 1:] - value[..., 1:, :1] - economy.c))
+        value[..., 1:, 0] = sigmoid(economy.r * gain.sum(axis=-1))
+        value[..., 1:, 1:] = sigmoid(economy.r * sellers[..., 1:, 1:] 
+                                     * (economy.u + value[..., 1:, :1] - value[..., 1:, 1:]))
+
+#-----------------------------------------------------------------------------------------#
+def make_rule(rule="reinforcement", learn=0.5, mode="sequential"):
+    """returns rule if it is a ValueRule, else the rule named rule: 
+    "reinforcement" (with learn and mode) or "sigmoid_bellman" """
+    
+    if isinstance(rule, ValueRule):
+        return rule
+    
+    assert rule in ("reinforcement", "sigmoid_bellman")
+    
+    return Reinforcement(learn, mode) if rule == "reinforcement" else SigmoidBellman()
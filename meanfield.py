@@ -0,0 +1,256 @@
+#coding=utf8
+import argparse
+import copy
+import itertools
+import numpy as np
+import eco
+import sweep
+
+
+#-----------------------------------------------------------------------------------------#
+def parameter_arrays(parameters):
+    """stacks a list of parameter dicts (same nb_countries) into arrays
+    whose first axis is the point, alpha and money are padded like Economy.alpha"""
+
+    n = parameters[0]["nb_countries"]
+    assert all(point["nb_countries"] == n for point in parameters), \
+        "points must have the same number of countries"
+
+    alpha = np.array([eco.country_table(point["alpha"], n, default=0) for point in parameters])
+    money = np.array([eco.country_vector(point["money"], n) for point in parameters])
+
+    arrays = {name: np.array([point[name] for point in parameters], dtype=float)
+              for name in ("c", "u", "r", "growth")}
+    arrays.update(alpha=alpha, money=money, nb_countries=n,
+                  pair_rate=(alpha + alpha.transpose(0, 2, 1)) / 2) #meetings of i and j
+
+    return arrays
+
+#-----------------------------------------------------------------------------------------#
+def repeat(arrays, times):
+    """arrays with each point repeated times times (point k becomes k * times, ...)"""
+
+    return {name: np.repeat(array, times, axis=0) if isinstance(array, np.ndarray) else array
+            for name, array in arrays.items()}
+
+#-----------------------------------------------------------------------------------------#
+def acceptance(eq, n):
+    """(point, seller nationality, currency) array of accepted currencies:
+    home currency always, foreign currencies if eq[seller nationality - 1]"""
+
+    accept = np.zeros((len(eq), n + 1, n + 1), dtype=bool)
+    accept[:, 1:, 1:] = eq[:, :, None]
+    accept[:, range(1, n + 1), range(1, n + 1)] = True
+
+    return accept
+
+#-----------------------------------------------------------------------------------------#
+def birth_shares(arrays):
+    """shares of newborns: country chosen uniformly, money of country i with probability money[i]"""
+
+    n = arrays["nb_countries"]
+    shares = np.zeros(arrays["alpha"].shape)
+    shares[:, 1:, 0] = (1 - arrays["money"][:, 1:]) / n
+    shares[:, range(1, n + 1), range(1, n + 1)] = arrays["money"][:, 1:] / n
+
+    return shares
+
+#-----------------------------------------------------------------------------------------#
+def law_of_motion(shares, eq, arrays):
+    """time derivative of shares (m_ic: agents of nationality i holding currency c / population).
+    A buyer of nationality i holding c meets a seller of nationality k at rate
+    pair_rate[i, k] * m_ic * m_k0 and pays if k accepts c, newborns arrive at rate growth"""
+
+    accept = acceptance(eq, arrays["nb_countries"])
+
+    #flow[p, i, k, c]: currency c paid by buyers of nationality i to sellers of nationality k
+    flow = arrays["pair_rate"][:, :, :, None] * shares[:, :, None, :] \
+           * (shares[:, None, :, 0, None] * accept[:, None, :, :])
+    flow[:, :, :, 0] = 0
+
+    paid = flow.sum(axis=2)
+    received = flow.sum(axis=1)
+
+    derivative = received - paid
+    derivative[:, :, 0] = paid.sum(axis=2) - received.sum(axis=2)
+    derivative += arrays["growth"][:, None, None] * (birth_shares(arrays) - shares)
+
+    return derivative
+
+#-----------------------------------------------------------------------------------------#
+def integrate(shares, arrays, duration, dt=0.05, eq=None):
+    """integrates the law of motion over duration (Runge Kutta 4).
+    If eq is None, sellers start accepting foreign currency and revise it
+    at each step from the values of the current shares and regime (see values)"""
+
+    shares = shares.copy()
+    regime = np.ones((len(shares), arrays["nb_countries"]), dtype=bool) if eq is None else eq
+
+    for k in range(int(np.ceil(duration / dt))):
+        if eq is None:
+            regime = accepts_foreign(values(shares, regime, arrays), arrays)
+
+        k1 = law_of_motion(shares, regime, arrays)
+        k2 = law_of_motion(shares + dt / 2 * k1, regime, arrays)
+        k3 = law_of_motion(shares + dt / 2 * k2, regime, arrays)
+        k4 = law_of_motion(shares + dt * k3, regime, arrays)
+        shares += dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    return shares
+
+#-----------------------------------------------------------------------------------------#
+def stationary_shares(arrays, eq, shares=None, tol=1e-12, max_iter=50, h=1e-6):
+    """solves law_of_motion(shares) = 0 for every point with Newton's method
+    (central differences give the exact jacobian of the quadratic law of motion).
+    Returns (shares, residual, converged), points without growth have no
+    stationary shares (money stock depends on initial state) and are nan"""
+
+    n = arrays["nb_countries"]
+    size = n * (n + 1)
+    shares = birth_shares(arrays) if shares is None else shares.copy()
+    x = shares[:, 1:, :].reshape(-1, size)
+    valid = arrays["growth"] > 0
+
+    def residual(x):
+        state = np.zeros(shares.shape)
+        state[:, 1:, :] = x.reshape(-1, n, n + 1)
+        return law_of_motion(state, eq, arrays)[:, 1:, :].reshape(-1, size)
+
+    for iteration in range(max_iter):
+        f = residual(x)
+        active = valid & (np.abs(f).max(axis=1) >= tol)
+        if not active.any():
+            break
+
+        jacobian = np.empty((len(x), size, size))
+        for j in range(size):
+            shift = np.zeros(size)
+            shift[j] = h
+            jacobian[:, :, j] = (residual(x + shift) - residual(x - shift)) / (2 * h)
+
+        jacobian[~active] = np.eye(size)
+        x[active] -= np.linalg.solve(jacobian[active], f[active, :, None])[:, :, 0]
+
+    f = np.abs(residual(x)).max(axis=1)
+    shares[:, 1:, :] = x.reshape(-1, n, n + 1)
+    shares[~valid] = np.nan
+    f[~valid] = np.nan
+
+    return shares, f, f < tol
+
+#-----------------------------------------------------------------------------------------#
+def values(shares, eq, arrays):
+    """stationary values (Bellman equations) of holding each currency given shares and eq:
+    r v_i0 = sum over c of (rate of meeting a buyer holding c accepted by i) * (v_ic - v_i0 - c)
+    r v_ic = (rate of meeting a seller accepting c) * (u + v_i0 - v_ic)"""
+
+    n = arrays["nb_countries"]
+    accept = acceptance(eq, n)
+    rate = arrays["pair_rate"]
+
+    #seller of i meets buyer holding c, buyer of i holding c meets a seller accepting c
+    selling = np.matmul(rate, shares) * accept
+    buying = np.matmul(rate, shares[:, :, 0, None] * accept)
+    selling[:, :, 0] = 0
+    buying[:, :, 0] = 0
+
+    r, c, u = (arrays[name][:, None] for name in ("r", "c", "u"))
+    system = np.zeros((len(shares), n, n + 1, n + 1))
+    rhs = np.zeros((len(shares), n, n + 1))
+    currencies = range(1, n + 1)
+
+    system[:, :, 0, 0] = r + selling[:, 1:].sum(axis=2)
+    system[:, :, 0, 1:] = -selling[:, 1:, 1:]
+    rhs[:, :, 0] = -c * selling[:, 1:].sum(axis=2)
+
+    system[:, :, currencies, 0] = -buying[:, 1:, 1:]
+    system[:, :, currencies, currencies] = r[:, :, None] + buying[:, 1:, 1:]
+    rhs[:, :, 1:] = u[:, :, None] * buying[:, 1:, 1:]
+
+    value = np.zeros(shares.shape)
+    value[:, 1:] = np.linalg.solve(system, rhs[..., None])[..., 0]
+
+    return value
+
+#-----------------------------------------------------------------------------------------#
+def accepts_foreign(value, arrays):
+    """(point, country) whether sellers gain from accepting every foreign currency,
+    same rule as the agents: value[i, c] - c > value[i, 0]"""
+
+    n = arrays["nb_countries"]
+    gain = value[:, 1:, 1:] - arrays["c"][:, None, None] > value[:, 1:, :1]
+    gain[:, range(n), range(n)] = True
+
+    return gain.all(axis=2)
+
+#-----------------------------------------------------------------------------------------#
+def solve(points, base=None, regimes=None, warmup=0., tol=1e-12, max_iter=50):
+    """stationary equilibria of every point (dict of parameter key: value, see sweep.grid).
+    For each regime (which countries accept foreign currency), solves the stationary
+    shares with Newton's method started from newborn shares (or from the law of motion
+    integrated during warmup) and computes values. A regime is an equilibrium of a point if its values
+    make sellers accept exactly the currencies of the regime.
+    regimes is a (regime, country) boolean array, every combination by default
+    (only none and all countries accepting beyond 8 countries).
+    Returns a dict of arrays indexed by (point, regime)"""
+
+    base = eco.PARAMETERS if base is None else base
+    parameters = []
+
+    for point in points:
+        parameters.append(copy.deepcopy(base))
+        for key, value in point.items():
+            sweep.set_parameter(parameters[-1], key, value)
+
+    arrays = parameter_arrays(parameters)
+    n = arrays["nb_countries"]
+    if regimes is None:
+        regimes = list(itertools.product([False, True], repeat=n)) if n <= 8 else \
+                  [[False] * n, [True] * n]
+    regimes = np.array(regimes, dtype=bool).reshape(-1, n)
+    arrays = repeat(arrays, len(regimes))
+    eq = np.tile(regimes, (len(points), 1))
+
+    shares = birth_shares(arrays)
+    if warmup:
+        shares = integrate(shares, arrays, warmup, eq=eq)
+
+    shares, residual, converged = stationary_shares(arrays, eq, shares, tol, max_iter)
+    value = values(np.nan_to_num(shares), eq, arrays)
+    consistent = converged & (accepts_foreign(value, arrays) == eq).all(axis=1)
+
+    shape = (len(points), len(regimes))
+
+    return {"regimes": regimes,
+            "shares": shares.reshape(shape + shares.shape[1:]),
+            "value": value.reshape(shape + value.shape[1:]),
+            "residual": residual.reshape(shape),
+            "converged": converged.reshape(shape),
+            "equilibrium": consistent.reshape(shape)}
+
+#-----------------------------------------------------------------------------------------#
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="stationary equilibria of the mean field model")
+    parser.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2,...",
+                        help="grid values of a parameter (e.g. alpha.1_2=5,9)")
+    parser.add_argument("--warmup", type=float, default=0.)
+    parser.add_argument("--output", default="meanfield.npz")
+    args = parser.parse_args(argv)
+
+    space = dict(item.split("=") for item in args.grid)
+    points = sweep.grid({key: sweep.parse_values(values) for key, values in space.items()})
+    result = solve(points, warmup=args.warmup)
+
+    columns = {key: np.array([point[key] for point in points]) for key in space}
+    np.savez(args.output, **dict(columns, **result))
+
+    for k, point in enumerate(points):
+        found = [regime for regime, ok in zip(result["regimes"], result["equilibrium"][k]) if ok]
+        print(point, "equilibria (foreign currency accepted by country):",
+              [tuple(int(flag) for flag in regime) for regime in found])
+
+    return result
+
+if __name__ == '__main__':
+    main()
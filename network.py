@@ -0,0 +1,203 @@
+#coding=utf8
+import numpy as np
+from eco import Economy
+
+
+class NeighborIndex(object):
+    """
+    Directed contacts of agents in CSR layout: contacts of agent a are
+    indices[indptr[a]:indptr[a + 1]].
+    Rows are only appended (one per new agent), so the index is built once
+    and then extended in place, arrays doubling their capacity when full.
+    """
+
+    def __init__(self, capacity=0, edge_capacity=0):
+
+        self.indptr = np.zeros(capacity + 1, dtype=np.int64)
+        self.indices = np.zeros(edge_capacity, dtype=np.int32)
+        self.size = 0 #number of rows (agents)
+        self.nb_edges = 0
+
+    #-----------------------------------------------------------------------------------------#
+    def __len__(self):
+
+        return self.size
+
+    #-----------------------------------------------------------------------------------------#
+    @property
+    def nbytes(self):
+
+        return self.indptr.nbytes + self.indices.nbytes
+
+    #-----------------------------------------------------------------------------------------#
+    def append(self, degrees, targets):
+        """adds one row per new agent, with degrees[k] contacts,
+        targets being the contacts of all new rows in row order"""
+
+        assert len(targets) == np.sum(degrees)
+        assert not len(targets) or np.max(targets) < np.iinfo(self.indices.dtype).max
+
+        rows = self.size + len(degrees)
+        edges = self.nb_edges + len(targets)
+
+        if rows + 1 > len(self.indptr):
+            indptr = np.zeros(max(rows + 1, 2 * len(self.indptr)), dtype=np.int64)
+            indptr[:self.size + 1] = self.indptr[:self.size + 1]
+            self.indptr = indptr
+
+        if edges > len(self.indices):
+            indices = np.zeros(max(edges, 2 * len(self.indices)), dtype=self.indices.dtype)
+            indices[:self.nb_edges] = self.indices[:self.nb_edges]
+            self.indices = indices
+
+        self.indptr[self.size + 1:rows + 1] = self.nb_edges + np.cumsum(degrees)
+        self.indices[self.nb_edges:edges] = targets
+        self.size = rows
+        self.nb_edges = edges
+
+    #-----------------------------------------------------------------------------------------#
+    def degree(self, agents):
+
+        return self.indptr[agents + 1] - self.indptr[agents]
+
+    #-----------------------------------------------------------------------------------------#
+    def neighbors(self, agent):
+
+        return self.indices[self.indptr[agent]:self.indptr[agent + 1]]
+
+    #-----------------------------------------------------------------------------------------#
+    def sample(self, agents, rng):
+        """one contact drawn uniformly with rng for each agent
+        (-1 for agents without contacts), O(1) per agent"""
+
+        start = self.indptr[agents]
+        degree = self.indptr[agents + 1] - start
+        pick = start + (rng.random(len(agents)) * degree).astype(np.int64)
+        contact = self.indices[np.minimum(pick, max(self.nb_edges - 1, 0))] if self.nb_edges else \
+                  np.zeros(len(agents), dtype=self.indices.dtype)
+
+        return np.where(degree > 0, contact, -1)
+
+#-----------------------------------------------------------------------------------------#
+def local_contacts(agents, nationality, pools, alpha, degree, rng, radius=None):
+    """draws degree contacts for each of agents: the country of a contact is j with
+    probability proportional to alpha[nationality, j]. Agents of a country sit on a ring
+    in order of arrival, a contact is drawn among agents of country j within radius
+    of the agent's position mapped on the ring of j (anywhere in j if radius is None),
+    draws come from the Generator rng. Returns targets in agent order (degree per agent)"""
+
+    targets = np.full((len(agents), degree), -1, dtype=np.int64)
+    rows = np.arange(len(agents))
+
+    for i in np.unique(nationality[agents]):
+        own = rows[nationality[agents] == i]
+        rates = alpha[i].cumsum()
+        if not rates[-1] or not len(own):
+            continue
+
+        #position of each agent on the ring of its country
+        rank = np.searchsorted(pools[i - 1], agents[own])
+        country = np.searchsorted(rates, rng.random((len(own), degree)) * rates[-1],
+                                  side="right")
+
+        for j in np.unique(country):
+            pool = pools[j - 1]
+            picked = country == j
+            source = np.broadcast_to(rank[:, None], picked.shape)[picked]
+
+            if radius is None:
+                position = rng.integers(len(pool), size=picked.sum())
+            else:
+                offset = rng.integers(-radius, radius + 1, size=picked.sum())
+                if j == i:
+                    offset[offset == 0] = 1 #not oneself
+                position = (source * len(pool) // len(pools[i - 1]) + offset) % len(pool)
+
+            targets[own[:, None].repeat(degree, axis=1)[picked], np.nonzero(picked)[1]] = \
+                pool[position]
+
+    return targets
+
+
+class NetworkEconomy(Economy):
+    """
+    Economy whose agents only meet their contacts (regions, ports, trade corridors):
+    each meeting of a tick picks an agent of the country of the pair uniformly,
+    who meets one of its contacts drawn uniformly (NeighborIndex).
+    Contacts are drawn with local_contacts when agents are born,
+    parameters "degree" and "radius" (None: anywhere in a country).
+    """
+
+    #the contact network is not part of the saved state
+    checkpoints = False
+
+    def __init__(self, parameters, seed=None):
+
+        #rows of the neighbor index are agent slots, which exits would move
+        if parameters.get("exit") is not None:
+            raise NotImplementedError("exits are not supported for NetworkEconomy")
+
+        self.degree = parameters.get("degree", 8)
+        self.radius = parameters.get("radius")
+        self.network = NeighborIndex(parameters["nb"], parameters["nb"] * self.degree)
+
+        super(NetworkEconomy, self).__init__(dict(parameters, matching="batched"), seed)
+
+    #-----------------------------------------------------------------------------------------#
+    def set_up(self):
+
+        super(NetworkEconomy, self).set_up()
+        self.add_contacts(0)
+
+    #-----------------------------------------------------------------------------------------#
+    def add_newborn(self, newborn):
+
+        start = len(self.agents)
+        super(NetworkEconomy, self).add_newborn(newborn)
+        self.add_contacts(start)
+
+    #-----------------------------------------------------------------------------------------#
+    def add_contacts(self, start):
+        """appends rows of agents from start to the neighbor index"""
+
+        agents = np.arange(start, len(self.agents))
+        if not len(agents):
+            return
+
+        targets = local_contacts(agents, self.nationality, self.get_sellers_and_buyers(),
+                                 self.alpha, self.degree, self.streams["births"], self.radius)
+        found = targets >= 0
+
+        self.network.append(found.sum(axis=1), targets[found])
+
+    #-----------------------------------------------------------------------------------------#
+    def main_agents_random_matching(self, nationality, meeting_dict):
+        """agents of country i start as many meetings as pairs (i, j) have,
+        each with one of their contacts. An agent meets at most once per tick:
+        meetings with an agent of an earlier kept meeting are dropped"""
+
+        counts = np.array(meeting_dict["ii"] + meeting_dict["ij"])
+        per_country = np.bincount(self.pairs[:, 0], weights=counts,
+                                  minlength=self.nb_countries + 1).astype(np.int64)
+
+        rng = self.streams["matching"]
+        first = np.concatenate([pool[rng.integers(len(pool), size=per_country[i + 1])]
+                                for i, pool in enumerate(nationality) if len(pool)] +
+                               [np.zeros(0, dtype=np.int64)])
+        second = self.network.sample(first, rng)
+
+        valid = (second >= 0) & (second != first)
+        first, second = first[valid], second[valid].astype(np.int64)
+
+        #meetings in order, kept unless one of the agents met in a kept one
+        #(a set of the agents met, sized by the meetings and not the population)
+        met = set()
+        kept = []
+        for k, (a, b) in enumerate(zip(first.tolist(), second.tolist())):
+            if a not in met and b not in met:
+                met.add(a)
+                met.add(b)
+                kept.append(k)
+
+        kept = np.array(kept, dtype=np.int64)
+        self.meet_pairs(first[kept], second[kept])
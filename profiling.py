@@ -0,0 +1,146 @@
+#coding=utf8
+import time
+import tracemalloc
+import numpy as np
+
+
+STAGES = ["increase_population", "inject_money", "add_newborn", "add_types",
+          "get_sellers_and_buyers", "poisson_distribution", "main_agents_random_matching",
+          "update_values", "get_steady_state"]
+
+COUNTERS = ["meetings", "trades", "trades_ii", "trades_ij",
+            "buyer_rejections", "seller_rejections", "exchange_list"]
+
+
+#-----------------------------------------------------------------------------------------#
+def run_stage(stage, function, *args):
+    """calls function, what Economy.step does when profiling is off"""
+
+    return function(*args)
+
+
+class Profiler(object):
+    """
+    Per tick instrumentation of an Economy: wall time and allocation delta
+    of each stage, meeting and trade counters.
+    The last capacity ticks are kept in ring buffers, totals since creation
+    are kept aside.
+    """
+
+    def __init__(self, capacity=4096, track_allocations=False):
+
+        self.capacity = capacity
+        self.track_allocations = track_allocations
+        self.counter_index = {name: k for k, name in enumerate(COUNTERS)}
+        self.stage_index = {name: k for k, name in enumerate(STAGES)}
+
+        self.steps = np.full(capacity, -1, dtype=np.int64)
+        self.seconds = np.zeros((capacity, len(STAGES)))
+        self.allocations = np.zeros((capacity, len(STAGES)), dtype=np.int64)
+        self.counters = np.zeros((capacity, len(COUNTERS)), dtype=np.int64)
+
+        self.total_seconds = np.zeros(len(STAGES))
+        self.total_counters = np.zeros(len(COUNTERS), dtype=np.int64)
+        self.ticks = 0
+        self.row = 0
+
+        #tracing started here is stopped by close
+        self.started_tracing = track_allocations and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    #-----------------------------------------------------------------------------------------#
+    def close(self):
+
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    #-----------------------------------------------------------------------------------------#
+    def start_tick(self, step):
+
+        self.row = self.ticks % self.capacity
+        self.steps[self.row] = step
+        self.seconds[self.row] = 0
+        self.allocations[self.row] = 0
+        self.counters[self.row] = 0
+
+    #-----------------------------------------------------------------------------------------#
+    def end_tick(self):
+
+        self.total_seconds += self.seconds[self.row]
+        self.total_counters += self.counters[self.row]
+        self.ticks += 1
+
+    #-----------------------------------------------------------------------------------------#
+    def stage(self, stage, function, *args):
+        """calls function and records its wall time (and allocation delta)"""
+
+        if self.track_allocations:
+            memory = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        output = function(*args)
+        self.seconds[self.row, self.stage_index[stage]] += time.perf_counter() - start
+
+        if self.track_allocations:
+            self.allocations[self.row, self.stage_index[stage]] += \
+                tracemalloc.get_traced_memory()[0] - memory
+
+        return output
+
+    #-----------------------------------------------------------------------------------------#
+    def count(self, counter, n=1):
+
+        self.counters[self.row, self.counter_index[counter]] += n
+
+    #-----------------------------------------------------------------------------------------#
+    def rows(self):
+        """indexes of recorded ticks in ring buffers, oldest first"""
+
+        if self.ticks <= self.capacity:
+            return np.arange(self.ticks)
+
+        return (np.arange(self.capacity) + self.ticks) % self.capacity
+
+    #-----------------------------------------------------------------------------------------#
+    def to_csv(self, path):
+        """writes recorded ticks, one row per tick"""
+
+        header = ["step"] + [stage + "_seconds" for stage in STAGES] \
+                 + [stage + "_allocated_bytes" for stage in STAGES] + COUNTERS
+        rows = self.rows()
+        table = np.column_stack([self.steps[rows], self.seconds[rows],
+                                 self.allocations[rows], self.counters[rows]])
+        fmt = ["%d"] + ["%.9g"] * len(STAGES) + ["%d"] * (len(STAGES) + len(COUNTERS))
+
+        np.savetxt(path, table, fmt=fmt, delimiter=",", header=",".join(header), comments="")
+
+    #-----------------------------------------------------------------------------------------#
+    def to_prometheus(self, prefix="economy"):
+        """returns totals and last tick gauges in Prometheus text format"""
+
+        lines = ["# HELP {}_ticks_total Ticks recorded.".format(prefix),
+                 "# TYPE {}_ticks_total counter".format(prefix),
+                 "{}_ticks_total {}".format(prefix, self.ticks),
+                 "# HELP {}_stage_seconds_total Wall time spent in each stage.".format(prefix),
+                 "# TYPE {}_stage_seconds_total counter".format(prefix)]
+        lines += ['{}_stage_seconds_total{{stage="{}"}} {:.9g}'.format(prefix, stage, seconds)
+                  for stage, seconds in zip(STAGES, self.total_seconds)]
+
+        lines += ["# HELP {}_events_total Meetings, trades and rejections.".format(prefix),
+                  "# TYPE {}_events_total counter".format(prefix)]
+        lines += ['{}_events_total{{event="{}"}} {}'.format(prefix, counter, total)
+                  for counter, total in zip(COUNTERS, self.total_counters)]
+
+        if self.ticks:
+            last = (self.ticks - 1) % self.capacity
+            lines += ["# HELP {}_step Step of the last tick.".format(prefix),
+                      "# TYPE {}_step gauge".format(prefix),
+                      "{}_step {}".format(prefix, self.steps[last]),
+                      "# HELP {}_exchange_list_length Agents who met during the last tick.".format(prefix),
+                      "# TYPE {}_exchange_list_length gauge".format(prefix),
+                      "{}_exchange_list_length {}".format(
+                          prefix, self.counters[last, self.counter_index["exchange_list"]])]
+
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,283 @@
+#coding=utf8
+import argparse
+import os
+import time
+import numpy as np
+from cache import ResultCache, result_key
+from convergence import ConvergenceMonitor, TESTS
+from trajectory import TrajectoryWriter, truncate_after
+
+
+class Trajectory(object):
+    """
+    Records economy state every record_every steps into preallocated arrays
+    (capacity doubles if the number of records is not known in advance).
+    """
+
+    def __init__(self, economy, capacity=16):
+
+        self.size = 0
+        self.columns = {}
+        self.shapes = {name: np.shape(record) for name, record in self.snapshot(economy).items()}
+        self.allocate(max(int(capacity), 1))
+
+    #-----------------------------------------------------------------------------------------#
+    @staticmethod
+    def snapshot(economy):
+        """returns state of economy to record"""
+
+        return {"step": economy.t,
+                "nb": economy.nb,
+                "value": economy.value,
+                "steady_state": np.array(economy.steady_state, dtype=float),
+                "equilibrium": np.array(economy.equilibrium, dtype=bool),
+                "counts": economy.counts}
+
+    #-----------------------------------------------------------------------------------------#
+    def allocate(self, capacity):
+
+        dtypes = {"step": np.int64, "nb": np.int64, "value": float,
+                  "steady_state": float, "equilibrium": bool, "counts": np.int64}
+
+        for name, shape in self.shapes.items():
+            column = np.zeros((capacity,) + shape, dtype=dtypes[name])
+            if name in self.columns:
+                column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+        self.capacity = capacity
+
+    #-----------------------------------------------------------------------------------------#
+    def record(self, economy):
+
+        if self.size == self.capacity:
+            self.allocate(2 * self.capacity)
+
+        for name, record in self.snapshot(economy).items():
+            self.columns[name][self.size] = record
+
+        self.size += 1
+
+    #-----------------------------------------------------------------------------------------#
+    def __getitem__(self, name):
+
+        return self.columns[name][:self.size]
+
+    #-----------------------------------------------------------------------------------------#
+    def as_dict(self):
+
+        return {name: self[name] for name in self.columns}
+
+
+class RunResult(object):
+    """final state of a run, why it stopped and its recorded trajectory"""
+
+    def __init__(self, economy, steps, reason, elapsed, trajectory):
+
+        self.steps = steps
+        self.reason = reason    #"n_steps", "time_budget", "converged" or "stationary"
+        self.elapsed = elapsed
+        self.value = economy.value.copy()
+        self.equilibrium = np.array(economy.equilibrium, dtype=bool)
+        self.steady_state = np.array(economy.steady_state, dtype=float)
+        self.trajectory = trajectory.as_dict()
+
+    #-----------------------------------------------------------------------------------------#
+    @classmethod
+    def load(cls, path):
+        """returns the RunResult saved in path by save"""
+
+        result = cls.__new__(cls)
+
+        with np.load(path) as saved:
+            result.steps = int(saved["steps"])
+            result.reason = str(saved["reason"])
+            result.elapsed = float(saved["elapsed"])
+            result.value = saved["value"]
+            result.equilibrium = saved["equilibrium"]
+            result.steady_state = saved["steady_state"]
+            result.trajectory = {name[len("trajectory_"):]: saved[name] for name in saved.files
+                                 if name.startswith("trajectory_")}
+
+        return result
+
+    #-----------------------------------------------------------------------------------------#
+    def save(self, path):
+        """saves final state and trajectory as a .npz file (path or file object)"""
+
+        trajectory = {"trajectory_" + name: column for name, column in self.trajectory.items()}
+
+        np.savez(path, steps=self.steps, reason=self.reason, elapsed=self.elapsed,
+                 value=self.value, equilibrium=self.equilibrium,
+                 steady_state=self.steady_state, **trajectory)
+
+    #-----------------------------------------------------------------------------------------#
+    def __repr__(self):
+
+        return "RunResult(steps={}, reason={!r}, elapsed={:.3f}s)".format(
+            self.steps, self.reason, self.elapsed)
+
+
+#-----------------------------------------------------------------------------------------#
+def converged(economy, tol):
+    """steady state equation is satisfied up to tol for every country"""
+
+    return max(abs(residual) for residual in economy.steady_state[1:]) < tol
+
+#-----------------------------------------------------------------------------------------#
+def run(economy, n_steps=None, tol=None, record_every=1, time_budget=None,
+        checkpoint_every=None, checkpoint_path=None, sink=None, monitor=None, cache=None):
+    """runs economy until n_steps steps are done, time_budget seconds are elapsed,
+    steady state residuals are below tol or monitor (a convergence.ConvergenceMonitor,
+    which may also coarsen the tick) finds it stationary (whichever comes first;
+    criteria left to None are not checked).
+    Records a snapshot every record_every steps (never if None), in memory
+    or to sink (a trajectory.TrajectoryWriter) if given,
+    and saves a checkpoint to checkpoint_path every checkpoint_every steps,
+    returns a RunResult.
+    With cache (a cache.ResultCache), runs of an economy at step 0 without time budget, 
+    checkpoints nor sink are looked up by parameters, seed, engine and run options:
+    a cached result is returned without running (economy is left unchanged),
+    others are stored once done. Economies seeded with fresh entropy never hit"""
+
+    assert not checkpoint_every or economy.checkpoints, \
+           "checkpoints are not supported for {}".format(type(economy).__name__)
+
+    key = None
+    if cache is not None and economy.t == 0 and time_budget is None \
+       and not checkpoint_every and sink is None:
+        key = result_key(economy, n_steps=n_steps, tol=tol, record_every=record_every,
+                         monitor=None if monitor is None else monitor.options)
+
+    if key is not None:
+        result = cache.get(key, RunResult.load)
+        if result is not None:
+            return result
+
+    in_memory = record_every and sink is None
+    capacity = n_steps // record_every + 1 if in_memory and n_steps is not None else 16
+    trajectory = Trajectory(economy, capacity)
+
+    start = time.perf_counter()
+    steps = 0
+
+    while True:
+
+        if n_steps is not None and steps >= n_steps:
+            reason = "n_steps"
+            break
+
+        if time_budget is not None and time.perf_counter() - start >= time_budget:
+            reason = "time_budget"
+            break
+
+        economy.step()
+        steps += 1
+
+        if record_every and steps % record_every == 0:
+            if sink is None:
+                trajectory.record(economy)
+            else:
+                sink.write(economy)
+
+        if checkpoint_every and economy.t % checkpoint_every == 0:
+            #records up to the checkpoint are on disk when it is
+            if sink is not None:
+                sink.flush()
+            economy.save_checkpoint(checkpoint_path)
+
+        if tol is not None and converged(economy, tol):
+            reason = "converged"
+            break
+
+        if monitor is not None and monitor.update(economy):
+            reason = "stationary"
+            break
+
+    if sink is not None:
+        sink.flush()
+
+    result = RunResult(economy, steps, reason, time.perf_counter() - start, trajectory)
+
+    if key is not None:
+        cache.put(key, result)
+
+    return result
+
+#-----------------------------------------------------------------------------------------#
+def main(economy_class, parameters, argv=None):
+    """command line entry point running economy_class headless"""
+
+    parser = argparse.ArgumentParser(description=economy_class.__doc__)
+    parser.add_argument("--steps", type=int, default=None, help="step budget")
+    parser.add_argument("--time-budget", type=float, default=None, help="wall clock budget (s)")
+    parser.add_argument("--tol", type=float, default=None, help="steady state tolerance")
+    parser.add_argument("--window", type=int, default=None,
+                        help="stops when windows of this many steps are stationary")
+    parser.add_argument("--test", choices=sorted(TESTS), default="welch",
+                        help="stationarity test between windows")
+    parser.add_argument("--max-tick", type=float, default=1.,
+                        help="coarsest tick far from steady state (needs --window)")
+    parser.add_argument("--cache", default=None, help="result cache directory (needs --seed)")
+    parser.add_argument("--cache-bytes", type=int, default=2 ** 30, 
+                        help="size of the result cache")
+    parser.add_argument("--record-every", type=int, default=1)
+    parser.add_argument("--nb", type=int, default=parameters["nb"])
+    parser.add_argument("--growth", type=float, default=parameters["growth"])
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--kernel", choices=["scalar", "numpy", "numba"], default=None,
+                        help="exchange kernel (see kernels)")
+    parser.add_argument("--output", default=None, help="saves result to this .npz file")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file")
+    parser.add_argument("--checkpoint-every", type=int, default=None)
+    parser.add_argument("--resume", action="store_true", help="starts from --checkpoint")
+    parser.add_argument("--trajectory", default=None, 
+                        help="streams records to this file instead of memory")
+    args = parser.parse_args(argv)
+
+    if args.steps is None and args.time_budget is None and args.tol is None \
+       and args.window is None:
+        parser.error("at least one of --steps, --time-budget, --tol and --window is required")
+
+    if (args.resume or args.checkpoint_every) and args.checkpoint is None:
+        parser.error("--resume and --checkpoint-every require --checkpoint")
+
+    if args.cache is not None and args.seed is None:
+        parser.error("--cache requires --seed")
+
+    if args.resume:
+        economy = economy_class.load_checkpoint(args.checkpoint)
+    else:
+        changes = {"nb": args.nb, "growth": args.growth}
+        if args.kernel is not None:
+            changes["kernel"] = args.kernel
+        economy = economy_class(dict(parameters, **changes), seed=args.seed)
+
+    #records written after the checkpoint would be written again
+    if args.resume and args.trajectory is not None and os.path.exists(args.trajectory):
+        truncate_after(args.trajectory, economy.t)
+
+    sink = None if args.trajectory is None else \
+           TrajectoryWriter(args.trajectory, economy.nb_countries)
+
+    monitor = None if args.window is None else \
+              ConvergenceMonitor(args.window, args.test, max_tick=args.max_tick)
+
+    result = run(economy, n_steps=args.steps, tol=args.tol,
+                 record_every=args.record_every, time_budget=args.time_budget,
+                 checkpoint_every=args.checkpoint_every, checkpoint_path=args.checkpoint,
+                 sink=sink, monitor=monitor, 
+                 cache=None if args.cache is None else ResultCache(args.cache, args.cache_bytes))
+
+    if sink is not None:
+        sink.close()
+
+    if args.output is not None:
+        result.save(args.output)
+
+    print(result)
+    print(result.value)
+    print(result.equilibrium)
+    print(result.steady_state)
+
+    return result
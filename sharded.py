@@ -0,0 +1,392 @@
+#coding=utf8
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from agents import AgentStore, RewardBuffer
+from eco import Economy
+from kernels import exchange_kernel
+
+
+#-----------------------------------------------------------------------------------------#
+def create_block(nbytes):
+
+    return shared_memory.SharedMemory(create=True, size=max(int(nbytes), 1))
+
+#-----------------------------------------------------------------------------------------#
+def attach_block(name):
+    """opens an existing block, the creating process owns it
+    (workers are spawned with the resource tracker of the main process,
+    where registering it again does nothing before python 3.13)"""
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: #python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+#-----------------------------------------------------------------------------------------#
+def release_block(block, unlink=True):
+
+    if unlink:
+        block.unlink()
+    try:
+        block.close()
+    except BufferError: #arrays still refer to it, mapping goes away with them
+        pass
+
+
+class SharedAgentStore(AgentStore):
+    """
+    AgentStore whose columns live in shared memory blocks, so that worker
+    processes read and write them without copies.
+    Growing the store moves columns to new blocks (see layout).
+    """
+
+    def __init__(self, columns, capacity=16):
+
+        self.size = 0
+        self.capacity = max(int(capacity), 1)
+        self.blocks = {}
+        self.columns = {name: self.allocate(name, dtype, self.capacity)
+                        for name, dtype in columns.items()}
+
+    #-----------------------------------------------------------------------------------------#
+    def allocate(self, name, dtype, capacity):
+        """returns a zeroed column of capacity agents in a new block"""
+
+        block = create_block(capacity * np.dtype(dtype).itemsize)
+        column = np.ndarray(capacity, dtype=dtype, buffer=block.buf)
+        column[:] = 0
+
+        if name in self.blocks:
+            release_block(self.blocks[name])
+        self.blocks[name] = block
+
+        return column
+
+    #-----------------------------------------------------------------------------------------#
+    def reserve(self, capacity):
+
+        if capacity <= self.capacity:
+            return
+
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+
+        for name, column in list(self.columns.items()):
+            old_block = self.blocks.pop(name)
+            new_column = self.allocate(name, column.dtype, new_capacity)
+            new_column[:self.size] = column[:self.size]
+            self.columns[name] = new_column
+            del column
+            release_block(old_block)
+
+        self.capacity = new_capacity
+
+    #-----------------------------------------------------------------------------------------#
+    def layout(self):
+        """(block name, dtype) of each column"""
+
+        return {name: (self.blocks[name].name, column.dtype.str)
+                for name, column in self.columns.items()}
+
+    #-----------------------------------------------------------------------------------------#
+    def close(self):
+
+        for block in self.blocks.values():
+            release_block(block)
+        self.blocks = {}
+
+
+class ShardedEconomy(Economy):
+    """
+    One economy whose matching runs on n_workers processes.
+    Agent columns, values and the shuffled pools of each shard are held in shared memory.
+    Agent k belongs to shard k % n_workers. Each tick, the main process draws the
+    number of meetings, splits them between shards (multinomial on shard pool sizes)
+    and plans how many agents each shard takes from each pool:
+    ii meetings pair agents of a shard, the agents of country i of shard s meet
+    agents of country j of shard (s + t + pair + 1) % n_workers, which is a one to
+    one pairing of shards, so every agent still meets at most once per tick.
+    Workers shuffle their pools, wait for each other, make the exchanges of their
+    meetings and send back count changes and reward aggregates (see ValueRule.aggregate),
+    merged in shard order into values.
+    Call close (or use as a context manager) to stop workers and free shared memory.
+    """
+
+    #worker streams and shared memory are not part of the saved state
+    checkpoints = False
+
+    def __init__(self, parameters, n_workers=None, seed=None):
+
+        #the shard of an agent is given by its slot, which exits would move
+        if parameters.get("exit") is not None:
+            raise NotImplementedError("exits are not supported for ShardedEconomy")
+
+        self.n_workers = os.cpu_count() if n_workers is None else n_workers
+        self.workers = []
+        self.connections = []
+        self.blocks = {}
+
+        super(ShardedEconomy, self).__init__(dict(parameters, matching="batched"), seed)
+
+        #values shared with workers
+        value = self.value
+        self.blocks["value"] = create_block(value.nbytes)
+        self.value = np.ndarray(value.shape, dtype=value.dtype, buffer=self.blocks["value"].buf)
+        self.value[:] = value
+
+        #agents of each shard and nationality
+        self.shard_sizes = np.zeros((self.n_workers, self.nb_countries + 1), dtype=np.int64)
+        self.count_shards(0)
+
+        #shuffled pools of each shard, start of pool of nationality i of shard s in perm
+        self.perm_capacity = 0
+        self.reserve_perm()
+        self.blocks["pools"] = create_block(self.n_workers * (self.nb_countries + 1) * 8)
+
+        self.aggregate = None
+
+        context = multiprocessing.get_context("spawn")
+        self.barrier = context.Barrier(self.n_workers) #kept alive while workers start
+        seeds = self.seed_sequence.spawn(self.n_workers)
+        static = {"nb_countries": self.nb_countries,
+                  "n_workers": self.n_workers,
+                  "c": self.c,
+                  "value_rule": self.value_rule,
+                  "kernel": self.kernel,
+                  "switch_type_array": self.switch_type_array,
+                  "value_shape": self.value.shape,
+                  "nb_home_pairs": self.nb_home_pairs,
+                  "pairs": self.pairs}
+
+        for shard in range(self.n_workers):
+            connection, child = context.Pipe()
+            worker = context.Process(target=run_worker, daemon=True,
+                                     args=(shard, seeds[shard], child, self.barrier, static))
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(connection)
+
+    #-----------------------------------------------------------------------------------------#
+    def set_up(self):
+
+        self.agents = SharedAgentStore({name: column.dtype
+                                        for name, column in self.agents.columns.items()},
+                                       capacity=self.agents.capacity)
+        super(ShardedEconomy, self).set_up()
+
+    #-----------------------------------------------------------------------------------------#
+    def count_shards(self, start):
+        """adds agents from start to shard_sizes"""
+
+        agents = np.arange(start, len(self.agents))
+        cells = (agents % self.n_workers) * (self.nb_countries + 1) + self.nationality[agents]
+
+        self.shard_sizes += np.bincount(cells, minlength=self.shard_sizes.size).reshape(
+                                                                      self.shard_sizes.shape)
+
+    #-----------------------------------------------------------------------------------------#
+    def reserve_perm(self):
+
+        if self.perm_capacity >= self.agents.capacity:
+            return
+
+        if "perm" in self.blocks:
+            release_block(self.blocks["perm"])
+
+        self.perm_capacity = self.agents.capacity
+        self.blocks["perm"] = create_block(self.perm_capacity * 8)
+
+    #-----------------------------------------------------------------------------------------#
+    def add_newborn(self, newborn):
+
+        start = len(self.agents)
+        super(ShardedEconomy, self).add_newborn(newborn)
+        self.count_shards(start)
+
+    #-----------------------------------------------------------------------------------------#
+    def get_sellers_and_buyers(self):
+        """pools are built by the workers"""
+
+        return None
+
+    #-----------------------------------------------------------------------------------------#
+    def plan(self, meeting_dict):
+        """returns (home, foreign): home[s, i] ii meetings of country i in shard s,
+        foreign[pair] rows (meetings, start in pool i of shard s,
+        other shard, start in its pool j) by shard s"""
+
+        sizes = self.shard_sizes
+        shards = np.arange(self.n_workers)
+        used = np.zeros(sizes.shape, dtype=np.int64)
+        home = np.zeros(sizes.shape, dtype=np.int64)
+
+        def split(n, i):
+            total = sizes[:, i].sum()
+            return self.streams["matching"].multinomial(n, sizes[:, i] / total) if total else np.zeros_like(shards)
+
+        for (i, _), n in zip(self.pairs[:self.nb_home_pairs], meeting_dict["ii"]):
+            home[:, i] = np.minimum(split(n, i), sizes[:, i] // 2)
+            used[:, i] = 2 * home[:, i]
+
+        foreign_pairs = np.sort(self.pairs[self.nb_home_pairs:], axis=1)
+        foreign = np.zeros((len(foreign_pairs), 4, self.n_workers), dtype=np.int64)
+
+        for pair, ((i, j), n) in enumerate(zip(foreign_pairs, meeting_dict["ij"])):
+            other = (shards + self.t + pair + 1) % self.n_workers
+            remaining = np.minimum(sizes[:, i] - used[:, i], sizes[other, j] - used[other, j])
+            k = np.minimum(split(n, i), np.maximum(remaining - 1, 0))
+            foreign[pair] = k, used[:, i], other, used[other, j]
+            used[:, i] += k
+            used[other, j] += k
+
+        return home, foreign
+
+    #-----------------------------------------------------------------------------------------#
+    def main_agents_random_matching(self, nationality, meeting_dict):
+
+        self.reserve_perm()
+        home, foreign = self.plan(meeting_dict)
+        layout = dict({name: (block.name, None) for name, block in self.blocks.items()},
+                      **self.agents.layout())
+
+        for connection in self.connections:
+            connection.send((layout, self.perm_capacity, len(self.agents), home, foreign))
+
+        results = [connection.recv() for connection in self.connections]
+
+        self.aggregate = self.value_rule.merge([result[0] for result in results]) \
+                         if self.value_rule.uses_rewards else None
+        self.counts += sum(result[1] for result in results)
+
+        if self.profiler is not None:
+            self.profiler.count("meetings", sum(result[2] for result in results))
+
+    #-----------------------------------------------------------------------------------------#
+    def update_values(self):
+        """moves values with the value rule, given the merged reward aggregates of the workers"""
+
+        self.value_rule.update(self, self.aggregate)
+        self.aggregate = None
+
+    #-----------------------------------------------------------------------------------------#
+    def close(self):
+        """stops workers and frees shared memory"""
+
+        for connection, worker in zip(self.connections, self.workers):
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.join()
+
+        self.workers, self.connections = [], []
+
+        for block in self.blocks.values():
+            release_block(block)
+        self.blocks = {}
+
+        if isinstance(self.agents, SharedAgentStore):
+            self.agents.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#-----------------------------------------------------------------------------------------#
+def run_worker(shard, seed, connection, barrier, static):
+    """loop of a worker process: one message (shared layout, sizes and plan) per tick"""
+
+    rng = np.random.default_rng(seed)
+    n_workers = static["n_workers"]
+    nb_countries = static["nb_countries"]
+    foreign_pairs = np.sort(static["pairs"][static["nb_home_pairs"]:], axis=1)
+
+    #economy reading shared arrays, used for its exchange rules
+    economy = Economy.__new__(Economy)
+    economy.c = static["c"]
+    economy.switch_type_array = static["switch_type_array"]
+    economy.kernel = static["kernel"]
+    economy.exchange_kernel = None if economy.kernel == "scalar" else exchange_kernel(economy.kernel)
+    economy.profiler = None
+    economy.rewards = RewardBuffer()
+    economy.counts = np.zeros(static["value_shape"], dtype=np.int64)
+    economy.agents = AgentStore({})
+
+    names = {}
+    blocks = {}
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        layout, perm_capacity, nb, home, foreign = message
+
+        if layout != names:
+            old_blocks = blocks
+            blocks = {name: attach_block(block_name) for name, (block_name, dtype) in layout.items()}
+            names = layout
+
+            economy.agents.columns = {name: np.ndarray(len(blocks[name].buf) // np.dtype(dtype).itemsize,
+                                                       dtype=dtype, buffer=blocks[name].buf)
+                                      for name, (block_name, dtype) in layout.items()
+                                      if dtype is not None}
+            economy.value = np.ndarray(static["value_shape"], buffer=blocks["value"].buf)
+            perm = np.ndarray(perm_capacity, dtype=np.int64, buffer=blocks["perm"].buf)
+            pools = np.ndarray((n_workers, nb_countries + 1), dtype=np.int64,
+                               buffer=blocks["pools"].buf)
+
+            for block in old_blocks.values():
+                release_block(block, unlink=False)
+
+        economy.agents.size = nb
+
+        #shuffled pools of the shard, grouped by nationality
+        own = np.arange(shard, nb, n_workers)
+        nationality = economy.nationality[own]
+        order = np.argsort(nationality, kind="stable")
+        segment = shard * (nb // n_workers) + min(shard, nb % n_workers)
+
+        pools[shard] = segment + np.searchsorted(nationality[order], np.arange(1, nb_countries + 2))
+        for i in range(1, nb_countries + 1):
+            start, end = pools[shard, i - 1] - segment, pools[shard, i] - segment
+            perm[segment + start:segment + end] = rng.permutation(own[order[start:end]])
+
+        barrier.wait()
+
+        pool = lambda s, i: perm[pools[s, i - 1]:pools[s, i]]
+        first, second = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+
+        for i in np.flatnonzero(home[shard]):
+            k = home[shard, i]
+            first.append(pool(shard, i)[:k])
+            second.append(pool(shard, i)[k:2 * k])
+
+        for (i, j), (k, start, other, other_start) in zip(foreign_pairs, foreign[:, :, shard]):
+            if k:
+                first.append(pool(shard, i)[start:start + k])
+                second.append(pool(other, j)[other_start:other_start + k])
+
+        first, second = np.concatenate(first), np.concatenate(second)
+        economy.meet_pairs(first, second)
+
+        rewards = economy.rewards
+        aggregate = None
+
+        if static["value_rule"].uses_rewards:
+            cells = economy.nationality[rewards["agent"]].astype(np.int64) \
+                    * static["value_shape"][1] + rewards["currency"]
+            aggregate = static["value_rule"].aggregate(cells, rewards["reward"], economy.value.size)
+
+        connection.send((aggregate, economy.counts.copy(), len(first)))
+
+        rewards.clear()
+        economy.counts[:] = 0
+
+    for block in blocks.values():
+        release_block(block, unlink=False)
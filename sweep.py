@@ -0,0 +1,209 @@
+#coding=utf8
+import argparse
+import copy
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import eco
+from cache import ResultCache
+from convergence import ConvergenceMonitor, TESTS
+
+
+#-----------------------------------------------------------------------------------------#
+def set_parameter(parameters, key, value):
+    """sets key of parameters in place. key is a parameter name ("c")
+    or a dotted path in a nested parameter ("alpha.1_2", "money.1").
+    A scalar given to a nested parameter ("money") is set to all its entries"""
+
+    path = key.split(".")
+    container = parameters
+
+    for name in path[:-1]:
+        container = container[name if name in container else int(name)]
+
+    name = path[-1] if path[-1] in container else int(path[-1])
+
+    if isinstance(container[name], dict) and not isinstance(value, dict):
+        for sub_name in container[name]:
+            container[name][sub_name] = value
+    else:
+        container[name] = value
+
+#-----------------------------------------------------------------------------------------#
+def grid(space):
+    """returns the list of points of the cartesian product of space
+    (dict of parameter key: list of values)"""
+
+    keys = list(space)
+
+    return [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+
+#-----------------------------------------------------------------------------------------#
+def random_design(space, n, seed=None):
+    """returns n points drawn uniformly in space
+    (dict of parameter key: (low, high))"""
+
+    rng = np.random.default_rng(seed)
+    draws = {key: rng.uniform(low, high, n) for key, (low, high) in space.items()}
+
+    return [{key: float(draws[key][k]) for key in space} for k in range(n)]
+
+#-----------------------------------------------------------------------------------------#
+def make_jobs(points, base=None, replicas=1, seed=None):
+    """returns one job per point and replica, each with its own parameters
+    and an independent seed spawned from seed"""
+
+    base = eco.PARAMETERS if base is None else base
+    seeds = np.random.SeedSequence(seed).spawn(len(points) * replicas)
+    jobs = []
+
+    for k, (point, replica) in enumerate(itertools.product(range(len(points)), range(replicas))):
+        parameters = copy.deepcopy(base)
+        for key, value in points[point].items():
+            set_parameter(parameters, key, value)
+
+        jobs.append({"job": k, "point": point, "replica": replica,
+                     "parameters": parameters, "seed": seeds[k]})
+
+    return jobs
+
+#snapshots recorded by runs of a cached sweep (see run_job)
+SUMMARY_RECORDS = 100
+
+#-----------------------------------------------------------------------------------------#
+def run_job(job, economy_class=eco.Economy, n_steps=None, tol=None, time_budget=None,
+            monitor=None, cache=None):
+    """runs one job in the current process, returns its final state.
+    monitor is None or the keyword arguments of its convergence.ConvergenceMonitor,
+    results are looked up in and stored to cache (a cache.ResultCache) if given,
+    with a summary trajectory of at most SUMMARY_RECORDS snapshots
+    (every 10 steps without n_steps)"""
+
+    monitor = None if monitor is None else ConvergenceMonitor(**monitor)
+    record_every = None if cache is None else \
+                   max(1, -(-n_steps // SUMMARY_RECORDS)) if n_steps else 10
+    economy = economy_class(job["parameters"], seed=job["seed"])
+    result = economy.run(n_steps=n_steps, tol=tol, time_budget=time_budget,
+                         record_every=record_every, monitor=monitor, cache=cache)
+
+    return {"steps": result.steps, "reason": result.reason, "elapsed": result.elapsed,
+            "value": result.value, "equilibrium": result.equilibrium,
+            "steady_state": result.steady_state}
+
+
+class SweepResult(object):
+    """
+    Columnar table of a sweep: one row per job,
+    one column per swept parameter and per output.
+    """
+
+    def __init__(self, jobs, points, outputs):
+
+        self.columns = {name: np.array([job[name] for job in jobs])
+                        for name in ("job", "point", "replica")}
+
+        for key in points[0] if points else []:
+            self.columns[key] = np.array([points[job["point"]][key] for job in jobs])
+
+        for name in outputs[0] if outputs else []:
+            self.columns[name] = np.array([output[name] for output in outputs])
+
+    #-----------------------------------------------------------------------------------------#
+    def __len__(self):
+
+        return len(self.columns["job"])
+
+    #-----------------------------------------------------------------------------------------#
+    def __getitem__(self, name):
+
+        return self.columns[name]
+
+    #-----------------------------------------------------------------------------------------#
+    def save(self, path):
+        """saves table as a .npz file"""
+
+        np.savez(path, **self.columns)
+
+#-----------------------------------------------------------------------------------------#
+def sweep(points, base=None, replicas=1, seed=None, n_steps=None, tol=None,
+          time_budget=None, workers=None, economy_class=eco.Economy, monitor=None, cache=None):
+    """runs every point replicas times on a pool of workers processes
+    (all cores if None), stopping stationary runs if monitor (see run_job) is given
+    and reusing results of cache (see run_job), returns a SweepResult"""
+
+    jobs = make_jobs(points, base=base, replicas=replicas, seed=seed)
+    workers = os.cpu_count() if workers is None else workers
+    run = partial(run_job, economy_class=economy_class, n_steps=n_steps,
+                  tol=tol, time_budget=time_budget, monitor=monitor, cache=cache)
+
+    if workers == 1:
+        outputs = [run(job) for job in jobs]
+    else:
+        chunksize = max(1, len(jobs) // (4 * workers))
+        with ProcessPoolExecutor(workers) as executor:
+            outputs = list(executor.map(run, jobs, chunksize=chunksize))
+
+    return SweepResult(jobs, points, outputs)
+
+#-----------------------------------------------------------------------------------------#
+def parse_values(text):
+
+    return [float(value) for value in text.split(",")]
+
+#-----------------------------------------------------------------------------------------#
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="parameter sweep over Economy runs")
+    parser.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2,...",
+                        help="grid values of a parameter (e.g. alpha.1_2=5,9)")
+    parser.add_argument("--uniform", action="append", default=[], metavar="KEY=LOW,HIGH",
+                        help="random design range of a parameter")
+    parser.add_argument("--points", type=int, default=10, help="size of random design")
+    parser.add_argument("--replicas", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--steps", type=int, default=None)
+    parser.add_argument("--tol", type=float, default=None)
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--window", type=int, default=None,
+                        help="stops runs when windows of this many steps are stationary")
+    parser.add_argument("--test", choices=sorted(TESTS), default="welch")
+    parser.add_argument("--max-tick", type=float, default=1.)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=None, help="result cache directory (needs --seed)")
+    parser.add_argument("--cache-bytes", type=int, default=2 ** 30)
+    parser.add_argument("--output", default="sweep.npz")
+    args = parser.parse_args(argv)
+
+    if args.steps is None and args.time_budget is None and args.tol is None \
+       and args.window is None:
+        parser.error("at least one of --steps, --time-budget, --tol and --window is required")
+
+    if args.cache is not None and args.seed is None:
+        parser.error("--cache requires --seed")
+
+    space = dict(item.split("=") for item in args.grid)
+    points = grid({key: parse_values(values) for key, values in space.items()})
+
+    if args.uniform:
+        space = dict(item.split("=") for item in args.uniform)
+        design = random_design({key: parse_values(values) for key, values in space.items()},
+                               args.points, args.seed)
+        points = [dict(point, **sample) for point in points for sample in design]
+
+    monitor = None if args.window is None else \
+              {"window": args.window, "test": args.test, "max_tick": args.max_tick}
+
+    result = sweep(points, replicas=args.replicas, seed=args.seed, n_steps=args.steps,
+                   tol=args.tol, time_budget=args.time_budget, workers=args.workers,
+                   monitor=monitor,
+                   cache=None if args.cache is None else ResultCache(args.cache, args.cache_bytes))
+    result.save(args.output)
+
+    print("{} jobs saved to {}".format(len(result), args.output))
+
+    return result
+
+if __name__ == '__main__':
+    main()
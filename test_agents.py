@@ -0,0 +1,86 @@
+#coding=utf8
+import numpy as np
+import pytest
+import eco
+from agents import AgentStore, MatchingPools
+
+
+#-----------------------------------------------------------------------------------------#
+def check_pools(pools, nationality):
+    """positions index members, and pool i holds exactly the agents of nationality i + 1"""
+
+    assert sum(pools.sizes) == len(nationality) == pools.nb_agents
+
+    for pool in range(len(pools.members)):
+        members = pools[pool]
+        assert np.array_equal(pools.position[members], np.arange(len(members)))
+        assert np.array_equal(np.sort(members), np.flatnonzero(nationality == pool + 1))
+
+#-----------------------------------------------------------------------------------------#
+def make_pools(nb=200, seed=0):
+
+    rng = np.random.default_rng(seed)
+    store = AgentStore({"nationality": np.int8}, capacity=4)
+    store.append(nb, nationality=rng.integers(1, 4, size=nb))
+    pools = MatchingPools(3, capacity=4)
+    pools.sync(store["nationality"])
+
+    return store, pools, rng
+
+#-----------------------------------------------------------------------------------------#
+def test_sync_and_draw_keep_positions():
+
+    store, pools, rng = make_pools()
+    check_pools(pools, store["nationality"])
+
+    pools.reset()
+    for pool in range(3):
+        for k in range(pools.sizes[pool] // 2):
+            pools.draw(pool, rng.random())
+
+    check_pools(pools, store["nationality"])
+
+#-----------------------------------------------------------------------------------------#
+def test_no_agent_drawn_twice_between_resets():
+
+    store, pools, rng = make_pools()
+
+    for tick in range(3):
+        pools.reset()
+        for pool in range(3):
+            drawn = [pools.draw(pool, rng.random()) for k in range(pools.sizes[pool])]
+            assert sorted(drawn) == sorted(pools[pool].tolist())
+            assert pools.available[pool] == 0
+
+#-----------------------------------------------------------------------------------------#
+def test_remove_and_move_keep_positions():
+
+    store, pools, rng = make_pools()
+
+    for repeat in range(5):
+        pools.reset()
+        for pool in range(3):
+            for k in range(pools.sizes[pool] // 3):
+                pools.draw(pool, rng.random())
+
+        leaving = rng.choice(len(store), 15, replace=False)
+        nationality = store["nationality"][leaving]
+        pools.remove(leaving, nationality - 1)
+        moved, slots = store.remove(leaving)
+        pools.move(moved, slots, store["nationality"][slots] - 1)
+        check_pools(pools, store["nationality"])
+
+        store.append(10, nationality=rng.integers(1, 4, size=10))
+        pools.sync(store["nationality"])
+        check_pools(pools, store["nationality"])
+
+#-----------------------------------------------------------------------------------------#
+@pytest.mark.parametrize("exit", ["hazard", "lifetime"])
+def test_pools_follow_population_with_exits(exit):
+
+    economy = eco.Economy(dict(eco.PARAMETERS, nb=600, growth=0.05, exit=exit), seed=2)
+
+    for t in range(60):
+        economy.step()
+        check_pools(economy.pools, economy.nationality)
+        assert len(economy.agents) == economy.nb == 600
@@ -0,0 +1,42 @@
+#coding=utf8
+import numpy as np
+import eco
+from batched import BatchedEconomy
+
+
+PARAMETERS = dict(eco.PARAMETERS, nb=400, growth=0.02)
+
+#-----------------------------------------------------------------------------------------#
+def final_states(economies, n_steps):
+    """values and m_ij shares of economies (one row per replica) after n_steps steps"""
+
+    values, shares = [], []
+
+    for economy in economies:
+        for t in range(n_steps):
+            economy.step()
+        values.append(np.reshape(economy.value, (-1,) + economy.value.shape[-2:]))
+        shares.append(np.reshape(economy.counts / economy.nb, (-1,) + economy.counts.shape[-2:]))
+
+    return np.concatenate(values), np.concatenate(shares)
+
+#-----------------------------------------------------------------------------------------#
+def test_replicas_match_separate_economies(agree):
+
+    #few replicas per economy, so that pools are larger than the number of replicas
+    batched = final_states([BatchedEconomy(PARAMETERS, 4, seed=seed) for seed in range(50)], 40)
+    separate = final_states([eco.Economy(dict(PARAMETERS, matching="batched"), seed=100 + seed)
+                             for seed in range(200)], 40)
+
+    assert not np.allclose(batched[0][:, 1:], 0.5)
+    assert agree(batched[0], separate[0])
+    assert agree(batched[1], separate[1])
+
+#-----------------------------------------------------------------------------------------#
+def test_single_replica_meets():
+
+    economy = BatchedEconomy(PARAMETERS, 1, seed=0)
+    for t in range(20):
+        economy.step()
+
+    assert not np.allclose(economy.value[:, 1:], 0.5)
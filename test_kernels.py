@@ -0,0 +1,88 @@
+#coding=utf8
+import numpy as np
+import pytest
+import eco
+from kernels import exchange_numpy, exchange_kernel
+
+
+#-----------------------------------------------------------------------------------------#
+def make_meetings(randomize, seed=0, nb=600):
+    """economy in a random state (see conftest.random_state) and random buyers
+    (holding money) and sellers (without money), each agent appearing at most once"""
+
+    economy = randomize(eco.Economy(dict(eco.PARAMETERS, nb=nb, kernel="scalar"), seed=seed),
+                        seed)
+    rng = np.random.default_rng(seed + 1000)
+
+    holders = rng.permutation(np.flatnonzero(economy.currency != 0))
+    others = rng.permutation(np.flatnonzero(economy.currency == 0))
+    n = min(len(holders), len(others))
+
+    return economy, holders[:n], others[:n]
+
+#-----------------------------------------------------------------------------------------#
+def exchange(function, economy, buyers, sellers):
+    """runs kernel function on copies of the state of economy,
+    returns (currency, counts, outputs of function)"""
+
+    currency, counts = economy.currency.copy(), economy.counts.copy()
+    outputs = function(buyers, sellers, economy.nationality, economy.type, currency,
+                       economy.value, economy.switch_type_array, economy.c, counts)
+
+    return currency, counts, outputs
+
+#-----------------------------------------------------------------------------------------#
+@pytest.mark.parametrize("seed", range(5))
+def test_numpy_kernel_matches_scalar(seed, random_state):
+
+    economy, buyers, sellers = make_meetings(random_state, seed)
+    currency, counts, (buyer_currency, buyer_acceptance, seller_acceptance) = \
+        exchange(exchange_numpy, economy, buyers, sellers)
+
+    for buyer, seller in zip(buyers.tolist(), sellers.tolist()):
+        economy.make_choice_and_exchange(buyer, seller)
+
+    assert np.array_equal(currency, economy.currency)
+    assert np.array_equal(counts, economy.counts)
+    assert np.array_equal(buyer_currency, economy.rewards["currency"][::2])
+    assert np.array_equal(buyer_acceptance & seller_acceptance,
+                          economy.rewards["reward"][::2] == 1)
+    assert (buyer_acceptance & seller_acceptance).any()
+
+#-----------------------------------------------------------------------------------------#
+@pytest.mark.parametrize("seed", range(5))
+def test_numba_kernel_matches_numpy(seed, random_state):
+
+    pytest.importorskip("numba")
+
+    economy, buyers, sellers = make_meetings(random_state, seed)
+    expected = exchange(exchange_numpy, economy, buyers, sellers)
+    result = exchange(exchange_kernel("numba"), economy, buyers, sellers)
+
+    assert np.array_equal(result[0], expected[0])
+    assert np.array_equal(result[1], expected[1])
+    for output, expected_output in zip(result[2], expected[2]):
+        assert np.array_equal(output, expected_output)
+
+#-----------------------------------------------------------------------------------------#
+@pytest.mark.parametrize("matching", ["scalar", "batched"])
+def test_runs_identical_across_kernels(matching):
+
+    kernels = ["scalar", "numpy"]
+    try:
+        exchange_kernel("numba")
+        kernels.append("numba")
+    except ImportError:
+        pass
+
+    states = []
+    for kernel in kernels:
+        economy = eco.Economy(dict(eco.PARAMETERS, nb=1000, matching=matching, kernel=kernel),
+                              seed=3)
+        for t in range(20):
+            economy.step()
+        states.append((economy.value, economy.counts, economy.currency, economy.nb))
+
+    for state in states[1:]:
+        for array, expected in zip(state, states[0]):
+            assert np.array_equal(array, expected)
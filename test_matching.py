@@ -0,0 +1,59 @@
+#coding=utf8
+import numpy as np
+import eco
+
+
+MEETINGS = {"ii": [25, 25], "ij": [40, 40]}
+
+#-----------------------------------------------------------------------------------------#
+def make_economy(randomize, matching, kernel="numpy"):
+    """economy in a random state (see conftest.random_state), the same whatever matching"""
+
+    return randomize(eco.Economy(dict(eco.PARAMETERS, nb=300, matching=matching, kernel=kernel),
+                                 seed=0), 1)
+
+#-----------------------------------------------------------------------------------------#
+def replicate(economy, n):
+    """number of trades and buyer rewards summed by (nationality, currency) cell
+    of n ticks of meetings MEETINGS, each from the same state"""
+
+    currency, counts = economy.currency.copy(), economy.counts.copy()
+    trades = np.zeros(n)
+    rewards = np.zeros((n,) + economy.value.shape)
+
+    for k in range(n):
+        economy.currency[:] = currency
+        economy.counts[:] = counts
+        economy.streams["matching"] = np.random.default_rng(k)
+        economy.rewards.clear()
+
+        economy.main_agents_random_matching(economy.get_sellers_and_buyers(), MEETINGS)
+
+        buyers = economy.rewards["currency"] != 0
+        agent, reward = economy.rewards["agent"][buyers], economy.rewards["reward"][buyers]
+        trades[k] = reward.sum()
+        np.add.at(rewards[k], (economy.nationality[agent], economy.rewards["currency"][buyers]),
+                  reward)
+
+    return trades, rewards
+
+#-----------------------------------------------------------------------------------------#
+def test_batched_matches_scalar_statistics(random_state, agree):
+
+    scalar_trades, scalar_rewards = replicate(make_economy(random_state, "scalar", "scalar"),
+                                              4000)
+    batched_trades, batched_rewards = replicate(make_economy(random_state, "batched"), 4000)
+
+    assert scalar_trades.mean() > 1
+    assert agree(scalar_trades, batched_trades)
+    assert agree(scalar_rewards, batched_rewards)
+
+#-----------------------------------------------------------------------------------------#
+def test_agents_meet_at_most_once(random_state):
+
+    for matching in ("scalar", "batched"):
+        economy = make_economy(random_state, matching)
+        economy.main_agents_random_matching(economy.get_sellers_and_buyers(), MEETINGS)
+
+        agents = economy.rewards["agent"]
+        assert len(agents) and len(np.unique(agents)) == len(agents)
@@ -0,0 +1,37 @@
+#coding=utf8
+import numpy as np
+import eco
+import runner
+from trajectory import TrajectoryReader
+
+
+#-----------------------------------------------------------------------------------------#
+def test_resume_does_not_repeat_records(tmp_path):
+
+    checkpoint, trajectory = str(tmp_path / "checkpoint.npz"), str(tmp_path / "run.traj")
+    argv = ["--nb", "300", "--seed", "1", "--checkpoint", checkpoint, "--checkpoint-every", "5",
+            "--trajectory", trajectory]
+
+    runner.main(eco.Economy, eco.PARAMETERS, argv + ["--steps", "13"])
+    runner.main(eco.Economy, eco.PARAMETERS, argv + ["--steps", "7", "--resume"])
+
+    assert np.array_equal(TrajectoryReader(trajectory)["step"], np.arange(1, 18))
+
+#-----------------------------------------------------------------------------------------#
+def test_checkpoint_keeps_seed(tmp_path):
+
+    path = str(tmp_path / "checkpoint.npz")
+    economy = eco.Economy(dict(eco.PARAMETERS, nb=300), seed=7)
+    for t in range(3):
+        economy.step()
+    economy.save_checkpoint(path)
+
+    loaded = eco.Economy.load_checkpoint(path)
+    assert loaded.seed_sequence.entropy == economy.seed_sequence.entropy
+    assert loaded.seed_sequence.spawn_key == economy.seed_sequence.spawn_key
+
+    for t in range(3):
+        economy.step()
+        loaded.step()
+    assert np.array_equal(loaded.value, economy.value)
+    assert np.array_equal(loaded.counts, economy.counts)
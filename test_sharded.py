@@ -0,0 +1,39 @@
+#coding=utf8
+import numpy as np
+import eco
+from sharded import ShardedEconomy
+
+
+PARAMETERS = dict(eco.PARAMETERS, nb=400, growth=0.02)
+
+#-----------------------------------------------------------------------------------------#
+def final_state(economy, n_steps):
+    """value, m_ij shares and trades of economy after n_steps steps. A trade changes
+    the currency of both agents, so trades are counted from currencies of agents
+    present before each step"""
+
+    trades = 0
+
+    for t in range(n_steps):
+        currency = economy.currency.copy()
+        economy.step()
+        trades += np.count_nonzero(economy.currency[:len(currency)] != currency) // 2
+
+    return economy.value.copy(), economy.counts / economy.nb, trades
+
+#-----------------------------------------------------------------------------------------#
+def test_shards_match_economy(agree):
+
+    sharded = []
+    for seed in range(24):
+        with ShardedEconomy(PARAMETERS, n_workers=2, seed=seed) as economy:
+            sharded.append(final_state(economy, 40))
+
+    separate = [final_state(eco.Economy(dict(PARAMETERS, matching="batched"), seed=100 + seed), 40)
+                for seed in range(200)]
+
+    sharded, separate = [list(map(np.array, zip(*states))) for states in (sharded, separate)]
+
+    assert sharded[2].mean() > 1
+    for a, b in zip(sharded, separate):
+        assert agree(a, b)
@@ -0,0 +1,163 @@
+#coding=utf8
+import json
+import os
+import struct
+import numpy as np
+
+
+MAGIC = b"ECOTRAJ1"
+
+
+#-----------------------------------------------------------------------------------------#
+def record_dtype(nb_countries):
+    """fixed width record of one step of an economy of nb_countries countries"""
+
+    n = nb_countries + 1
+
+    return np.dtype([("step", np.int64),
+                     ("nb", np.int64),
+                     ("value", np.float64, (n, n)),
+                     ("steady_state", np.float64, (n,)),
+                     ("equilibrium", np.bool_, (n,)),
+                     ("shares", np.float64, (n, n))]) #counts / nb (m_ij)
+
+
+class TrajectoryWriter(object):
+    """
+    Appends one fixed width binary record per call to write to an append-only file.
+    Records are buffered in a chunk of chunk records that is flushed when full,
+    so memory use is bounded whatever the length of the run.
+    File layout: magic, header length (uint32), JSON header, records.
+    """
+
+    def __init__(self, path, nb_countries=2, chunk=1024):
+
+        self.dtype = record_dtype(nb_countries)
+        self.chunk = np.zeros(chunk, dtype=self.dtype)
+        self.size = 0
+
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+
+        if exists:
+            header = read_header(path)
+            assert np.dtype(header["descr"]) == self.dtype, "record layout differs from file"
+
+            #drops an incomplete last record (interrupted write), appends stay aligned
+            n = (os.path.getsize(path) - header["offset"]) // self.dtype.itemsize
+            os.truncate(path, header["offset"] + n * self.dtype.itemsize)
+
+        self.file = open(path, "ab")
+
+        if not exists:
+            header = json.dumps({"descr": np.lib.format.dtype_to_descr(self.dtype),
+                                 "nb_countries": nb_countries}).encode()
+            self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    #-----------------------------------------------------------------------------------------#
+    def write(self, economy):
+        """appends current state of economy"""
+
+        if self.size == len(self.chunk):
+            self.flush()
+
+        record = self.chunk[self.size]
+        record["step"] = economy.t
+        record["nb"] = economy.nb
+        record["value"] = economy.value
+        record["steady_state"] = economy.steady_state
+        record["equilibrium"] = economy.equilibrium
+        record["shares"] = economy.counts / economy.nb
+        self.size += 1
+
+    #-----------------------------------------------------------------------------------------#
+    def flush(self):
+
+        self.file.write(self.chunk[:self.size].tobytes())
+        self.file.flush()
+        self.size = 0
+
+    #-----------------------------------------------------------------------------------------#
+    def close(self):
+
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#-----------------------------------------------------------------------------------------#
+def read_header(path):
+    """returns (header dict with its byte length as "offset") of a trajectory file"""
+
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC, "not a trajectory file"
+        length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode())
+
+    header["descr"] = [tuple(field) if len(field) == 2 else (field[0], field[1], tuple(field[2]))
+                       for field in header["descr"]]
+    header["offset"] = len(MAGIC) + 4 + length
+
+    return header
+
+#-----------------------------------------------------------------------------------------#
+def truncate_after(path, step):
+    """drops records from the first one whose step is above step
+    (records written after a checkpoint at step, before resuming from it)"""
+
+    header = read_header(path)
+    dtype = np.dtype(header["descr"])
+    n = (os.path.getsize(path) - header["offset"]) // dtype.itemsize
+
+    if not n:
+        return
+
+    records = np.memmap(path, dtype=dtype, mode="r", offset=header["offset"], shape=(n,))
+    later = np.flatnonzero(records["step"] > step)
+    del records
+
+    if len(later):
+        os.truncate(path, header["offset"] + later[0] * dtype.itemsize)
+
+
+class TrajectoryReader(object):
+    """
+    Memory maps a file written by TrajectoryWriter.
+    Slicing returns views, only pages that are read are loaded.
+    An incomplete last record (interrupted write) is ignored.
+    """
+
+    def __init__(self, path):
+
+        header = read_header(path)
+        self.dtype = np.dtype(header["descr"])
+        n = (os.path.getsize(path) - header["offset"]) // self.dtype.itemsize
+
+        self.records = np.memmap(path, dtype=self.dtype, mode="r",
+                                 offset=header["offset"], shape=(n,)) if n else \
+                       np.zeros(0, dtype=self.dtype)
+
+    #-----------------------------------------------------------------------------------------#
+    def __len__(self):
+
+        return len(self.records)
+
+    #-----------------------------------------------------------------------------------------#
+    def __getitem__(self, key):
+        """records by position (int, slice) or field name"""
+
+        return self.records[key]
+
+    #-----------------------------------------------------------------------------------------#
+    def steps(self, start=None, stop=None):
+        """records whose step is in [start, stop) (steps are increasing)"""
+
+        step = self.records["step"]
+        first = 0 if start is None else np.searchsorted(step, start, side="left")
+        last = len(step) if stop is None else np.searchsorted(step, stop, side="left")
+
+        return self.records[first:last]